@@ -1,19 +1,17 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from datetime import datetime
 from dotenv import load_dotenv
 import os
+import time
+from app.logging_config import setup_logging, shutdown_logging
+from app.metrics import HTTP_REQUEST_SECONDS, render_latest
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    filename=f'app_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -32,14 +30,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Time every request, labelled by route template so ids don't explode the label set."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        if path != "/metrics":
+            HTTP_REQUEST_SECONDS.labels(request.method, path, str(status)).observe(
+                time.perf_counter() - started
+            )
+
 # Import routers
-from routes import invoices #, payments, ledger, outstanding, commission, alerts
+from routes import invoices, outstanding, ledger, payments #, commission, alerts
 
 # Include routers with prefixes
 app.include_router(invoices.router, prefix="/api/v1/invoices", tags=["invoices"])
-# app.include_router(payments.router, prefix="/api/v1/payments", tags=["payments"])
-# app.include_router(ledger.router, prefix="/api/v1/ledger", tags=["ledger"])
-# app.include_router(outstanding.router, prefix="/api/v1/outstanding", tags=["outstanding"])
+app.include_router(payments.router, prefix="/api/v1/payments", tags=["payments"])
+app.include_router(ledger.router, prefix="/api/v1/ledger", tags=["ledger"])
+app.include_router(outstanding.router, prefix="/api/v1/outstanding", tags=["outstanding"])
 # app.include_router(commission.router, prefix="/api/v1/commission", tags=["commission"])
 # app.include_router(alerts.router, prefix="/api/v1/alerts", tags=["alerts"])
 
@@ -60,6 +75,12 @@ async def root():
         ]
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    content, content_type = render_latest()
+    return Response(content=content, media_type=content_type)
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler."""
@@ -73,7 +94,21 @@ async def startup_event():
         logger.error(f"Database connection failed: {str(e)}")
         raise
 
+    # Check extraction settings without loading the ingestion stack
+    from services.gemini import validate_config
+    for problem in validate_config():
+        logger.warning(f"Configuration: {problem}")
+
+    # Start background PDF ingestion workers
+    from services.jobs import job_manager
+    await job_manager.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler."""
-    logger.info("Shutting down the application...")
\ No newline at end of file
+    logger.info("Shutting down the application...")
+    from services.jobs import job_manager
+    await job_manager.stop()
+    from services.rendering import shutdown_render_pool
+    shutdown_render_pool()
+    shutdown_logging()
\ No newline at end of file
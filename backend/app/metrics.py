@@ -0,0 +1,91 @@
+import os
+import time
+import inspect
+import functools
+from typing import Callable, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+)
+
+# Latency buckets (seconds) shared by request, database and model histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of API requests by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+DB_CALL_SECONDS = Histogram(
+    "db_call_duration_seconds",
+    "Latency of Database methods",
+    ["method", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+GEMINI_REQUEST_SECONDS = Histogram(
+    "gemini_request_duration_seconds",
+    "Latency of Gemini generate_content calls, excluding rate-limiter waits",
+    ["kind", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+GEMINI_TOKENS = Counter(
+    "gemini_tokens_total",
+    "Tokens reported by Gemini usage metadata",
+    ["kind", "direction"]
+)
+GEMINI_RETRIES = Counter(
+    "gemini_retries_total",
+    "Gemini calls retried after a rate-limit response",
+    ["kind"]
+)
+EXTRACTION_CACHE_LOOKUPS = Counter(
+    "extraction_cache_lookups_total",
+    "Extraction cache lookups by result",
+    ["result"]
+)
+RENDER_SECONDS = Histogram(
+    "pdf_render_duration_seconds",
+    "PDF rasterisation time",
+    ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+def instrument_methods(histogram: Histogram) -> Callable[[type], type]:
+    """
+    Class decorator timing every public coroutine method into `histogram`,
+    labelled with the method name and whether it raised.
+    """
+    def decorate(cls: type) -> type:
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(method):
+                continue
+            setattr(cls, name, _timed(histogram, name, method))
+        return cls
+    return decorate
+
+
+def _timed(histogram: Histogram, name: str, method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await method(*args, **kwargs)
+            outcome = "success"
+            return result
+        finally:
+            histogram.labels(name, outcome).observe(time.perf_counter() - started)
+    return wrapper
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Exposition payload and content type for the /metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several worker processes: merge their metric files
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
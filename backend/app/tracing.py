@@ -0,0 +1,45 @@
+import os
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+
+_tracer = None
+
+
+def _get_tracer():
+    """OpenTelemetry tracer, or None when tracing is off or the package is missing."""
+    global _tracer
+    if not TRACING_ENABLED:
+        return None
+    if _tracer is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logger.warning("TRACING_ENABLED is set but opentelemetry is not installed")
+            return None
+        _tracer = trace.get_tracer("invoice-backend")
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[None]:
+    """
+    Trace a block as an OpenTelemetry span; a no-op unless tracing is enabled.
+    Exporters are configured by the OpenTelemetry SDK/auto-instrumentation.
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        yield
+        return
+    with tracer.start_as_current_span(name) as current:
+        for key, value in attributes.items():
+            if value is not None:
+                current.set_attribute(key, value)
+        yield
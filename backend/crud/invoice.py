@@ -84,7 +84,7 @@ async def get_overdue_invoices(db: Client) -> List[dict]:
         result = db.table('invoices')\
             .select("*")\
             .lt('due_date', current_date)\
-            .not_eq('status', InvoiceStatus.PAID.value)\
+            .neq('status', InvoiceStatus.PAID.value)\
             .execute()
         return result.data
     except Exception as e:
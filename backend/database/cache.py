@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INVOICE_CACHE_TTL = int(os.getenv("INVOICE_CACHE_TTL", 30))
+INVOICE_CACHE_SIZE = int(os.getenv("INVOICE_CACHE_SIZE", 10_000))
+INVOICE_CACHE_REDIS = os.getenv("INVOICE_CACHE_REDIS", "false").lower() == "true"
+# API worker processes, as read by uvicorn/gunicorn for their --workers default
+API_WORKERS = int(os.getenv("WEB_CONCURRENCY", 1))
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key: Any) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Any) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class InvoiceCache:
+    """
+    Read-through cache for invoices by id.
+    Without Redis, rows live in a local LRU tier. With Redis, every worker
+    reads and invalidates the shared Redis tier only: a local copy could not
+    be invalidated by writes in other workers and would serve stale rows
+    (and stale ETags). With `local=False` and no Redis nothing is cached.
+    """
+
+    def __init__(self, max_size: int, ttl: int, redis_url: Optional[str] = None, local: bool = True):
+        self.ttl = ttl
+        self._local: Optional[TTLCache] = None
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.Redis.from_url(redis_url)
+        elif local:
+            self._local = TTLCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _redis_key(invoice_id: int) -> str:
+        return f"invoice:{invoice_id}"
+
+    async def get(self, invoice_id: int) -> Optional[Dict]:
+        invoice = None
+        if self._local is not None:
+            invoice = self._local.get(invoice_id)
+        elif self._redis is not None:
+            try:
+                raw = await self._redis.get(self._redis_key(invoice_id))
+                if raw is not None:
+                    invoice = json.loads(raw)
+            except Exception as e:
+                logger.error(f"Error reading invoice cache: {str(e)}")
+        if invoice is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(invoice)
+
+    async def set(self, invoice: Dict) -> None:
+        if not invoice or invoice.get('id') is None:
+            return
+        if self._local is not None:
+            self._local.set(invoice['id'], dict(invoice))
+        if self._redis is not None:
+            try:
+                await self._redis.set(
+                    self._redis_key(invoice['id']), json.dumps(invoice, default=str), ex=self.ttl
+                )
+            except Exception as e:
+                logger.error(f"Error writing invoice cache: {str(e)}")
+
+    async def invalidate(self, invoice_id: int) -> None:
+        if self._local is not None:
+            self._local.delete(invoice_id)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self._redis_key(invoice_id))
+            except Exception as e:
+                logger.error(f"Error invalidating invoice cache: {str(e)}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._local) if self._local is not None else 0,
+        }
+
+
+@lru_cache()
+def get_invoice_cache() -> InvoiceCache:
+    """Get the process-wide invoice cache configured from the environment."""
+    redis_url = os.getenv("REDIS_URL") if INVOICE_CACHE_REDIS else None
+    # Per-worker caches cannot see each other's writes, so If-Match checks would
+    # fail at random depending on which worker answers: several workers need Redis
+    local = API_WORKERS <= 1
+    if not redis_url and not local:
+        logger.warning(
+            f"Invoice cache disabled: {API_WORKERS} workers need INVOICE_CACHE_REDIS=true to share it"
+        )
+    return InvoiceCache(INVOICE_CACHE_SIZE, INVOICE_CACHE_TTL, redis_url, local)
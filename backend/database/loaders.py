@@ -0,0 +1,41 @@
+import asyncio
+from typing import Dict, List
+
+class PaymentLoader:
+    """
+    Request-scoped batcher for payments by invoice id.
+    Every load() issued in the same event-loop tick is resolved by a single
+    `in` query, and repeated ids within a request are only fetched once.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._results: Dict[int, asyncio.Future] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    def load(self, invoice_id: int) -> "asyncio.Future[List[Dict]]":
+        """Schedule `invoice_id` for the next batch and return a future for its payments."""
+        if invoice_id in self._results:
+            return self._results[invoice_id]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._results[invoice_id] = future
+        if not self._pending:
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        self._pending[invoice_id] = future
+        return future
+
+    async def load_many(self, invoice_ids: List[int]) -> List[List[Dict]]:
+        return await asyncio.gather(*(self.load(invoice_id) for invoice_id in invoice_ids))
+
+    async def _dispatch(self) -> None:
+        batch, self._pending = self._pending, {}
+        try:
+            payments = await self.db.get_payments_by_invoices(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        for invoice_id, future in batch.items():
+            future.set_result(payments.get(invoice_id, []))
@@ -0,0 +1,36 @@
+import json
+import base64
+from typing import Any, Dict, Optional, Tuple
+
+# Columns that can drive keyset pagination; each is paired with `id` as tie-breaker
+KEYSET_SORT_COLUMNS = ("due_date", "created_at", "id")
+
+
+def encode_cursor(sort: str, row: Dict) -> str:
+    """Build an opaque cursor pointing just after `row` in `sort` order."""
+    payload = {"s": sort, "k": row.get(sort), "id": row["id"]}
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    """Return the (sort key, id) position stored in a cursor; raises ValueError if invalid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        key, row_id = payload["k"], int(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if payload.get("s") != sort:
+        raise ValueError("Cursor was issued for a different sort order")
+    return key, row_id
+
+
+def keyset_filter(sort: str, cursor: Optional[str]) -> Optional[str]:
+    """PostgREST `or` filter selecting rows strictly after the cursor position."""
+    if not cursor:
+        return None
+    key, row_id = decode_cursor(cursor, sort)
+    if sort == "id":
+        return f"id.gt.{row_id}"
+    return f'{sort}.gt."{key}",and({sort}.eq."{key}",id.gt.{row_id})'
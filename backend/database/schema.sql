@@ -11,6 +11,8 @@ CREATE TABLE suppliers (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     gst_no VARCHAR(50) UNIQUE,
+    -- Normalised name of parties without a GSTIN, so concurrent uploads create one row
+    name_key VARCHAR(255) UNIQUE,
     email VARCHAR(255),
     phone VARCHAR(20),
     address TEXT,
@@ -26,6 +28,8 @@ CREATE TABLE buyers (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     gst_no VARCHAR(50) UNIQUE,
+    -- Normalised name of parties without a GSTIN, so concurrent uploads create one row
+    name_key VARCHAR(255) UNIQUE,
     email VARCHAR(255),
     phone VARCHAR(20),
     address TEXT,
@@ -120,4 +124,513 @@ CREATE INDEX idx_invoices_due_date ON invoices(due_date);
 CREATE INDEX idx_invoices_buyer_id ON invoices(buyer_id);
 CREATE INDEX idx_invoices_supplier_id ON invoices(supplier_id);
 CREATE INDEX idx_payments_invoice_id ON payments(invoice_id);
-CREATE INDEX idx_invoice_items_invoice_id ON invoice_items(invoice_id); 
\ No newline at end of file
+CREATE INDEX idx_invoice_items_invoice_id ON invoice_items(invoice_id);
+
+-- Composite indexes backing keyset (cursor) pagination
+CREATE INDEX idx_invoices_due_date_id ON invoices(due_date, id);
+CREATE INDEX idx_invoices_created_at_id ON invoices(created_at, id);
+
+-- Outstanding balance per invoice, maintained incrementally by triggers so
+-- aging reports aggregate one narrow table instead of joining payments
+CREATE TABLE invoice_balances (
+    invoice_id INTEGER PRIMARY KEY REFERENCES invoices(id) ON DELETE CASCADE,
+    buyer_id INTEGER,
+    supplier_id INTEGER,
+    due_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    total_amount DECIMAL(12,2) NOT NULL,
+    paid_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+    outstanding DECIMAL(12,2) GENERATED ALWAYS AS (total_amount - paid_amount) STORED,
+    is_open BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+CREATE INDEX idx_invoice_balances_buyer_open ON invoice_balances(buyer_id) WHERE is_open;
+CREATE INDEX idx_invoice_balances_supplier_open ON invoice_balances(supplier_id) WHERE is_open;
+CREATE INDEX idx_invoice_balances_due_date_open ON invoice_balances(due_date) WHERE is_open;
+
+CREATE OR REPLACE FUNCTION sync_invoice_balance()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO invoice_balances (invoice_id, buyer_id, supplier_id, due_date, total_amount, is_open)
+    VALUES (NEW.id, NEW.buyer_id, NEW.supplier_id, NEW.due_date, NEW.total_amount,
+            NEW.status NOT IN ('paid', 'cancelled'))
+    ON CONFLICT (invoice_id) DO UPDATE SET
+        buyer_id = EXCLUDED.buyer_id,
+        supplier_id = EXCLUDED.supplier_id,
+        due_date = EXCLUDED.due_date,
+        total_amount = EXCLUDED.total_amount,
+        is_open = EXCLUDED.is_open;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER sync_invoice_balance_on_invoice
+    AFTER INSERT OR UPDATE OF buyer_id, supplier_id, due_date, total_amount, status ON invoices
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_invoice_balance();
+
+-- Apply the change in completed payment amount to the paid invoice only
+CREATE OR REPLACE FUNCTION apply_payment_to_balance()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' THEN
+        UPDATE invoice_balances SET paid_amount = paid_amount - OLD.amount
+        WHERE invoice_id = OLD.invoice_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+        UPDATE invoice_balances SET paid_amount = paid_amount + NEW.amount
+        WHERE invoice_id = NEW.invoice_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER apply_payment_to_balance_on_payment
+    AFTER INSERT OR UPDATE OF amount, status, invoice_id OR DELETE ON payments
+    FOR EACH ROW
+    EXECUTE FUNCTION apply_payment_to_balance();
+
+-- Backfill balances for invoices created before the triggers existed
+INSERT INTO invoice_balances (invoice_id, buyer_id, supplier_id, due_date, total_amount, paid_amount, is_open)
+SELECT i.id, i.buyer_id, i.supplier_id, i.due_date, i.total_amount,
+       COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'completed'), 0),
+       i.status NOT IN ('paid', 'cancelled')
+FROM invoices i
+LEFT JOIN payments p ON p.invoice_id = i.id
+GROUP BY i.id
+ON CONFLICT (invoice_id) DO NOTHING;
+
+-- Aging buckets of open balances per buyer or supplier, aggregated in the database
+CREATE OR REPLACE FUNCTION aging_report(p_group_by TEXT DEFAULT 'buyer', p_as_of DATE DEFAULT CURRENT_DATE)
+RETURNS TABLE (
+    party_id INTEGER,
+    not_due DECIMAL,
+    days_0_30 DECIMAL,
+    days_31_60 DECIMAL,
+    days_61_90 DECIMAL,
+    days_over_90 DECIMAL,
+    total_outstanding DECIMAL,
+    invoice_count BIGINT
+) AS $$
+    SELECT
+        CASE WHEN p_group_by = 'supplier' THEN b.supplier_id ELSE b.buyer_id END AS party_id,
+        COALESCE(SUM(b.outstanding) FILTER (WHERE b.due_date::date >= p_as_of), 0),
+        COALESCE(SUM(b.outstanding) FILTER (WHERE p_as_of - b.due_date::date BETWEEN 1 AND 30), 0),
+        COALESCE(SUM(b.outstanding) FILTER (WHERE p_as_of - b.due_date::date BETWEEN 31 AND 60), 0),
+        COALESCE(SUM(b.outstanding) FILTER (WHERE p_as_of - b.due_date::date BETWEEN 61 AND 90), 0),
+        COALESCE(SUM(b.outstanding) FILTER (WHERE p_as_of - b.due_date::date > 90), 0),
+        SUM(b.outstanding),
+        COUNT(*)
+    FROM invoice_balances b
+    WHERE b.is_open AND b.outstanding > 0
+    GROUP BY 1
+    ORDER BY 7 DESC;
+$$ language 'sql' STABLE;
+
+-- Buyer/supplier ledger: append-only entries with running balances, posted by
+-- triggers as invoices and payments are written
+CREATE TYPE ledger_party_type AS ENUM ('buyer', 'supplier');
+
+CREATE TABLE ledger_entries (
+    id BIGSERIAL PRIMARY KEY,
+    party_type ledger_party_type NOT NULL,
+    party_id INTEGER NOT NULL,
+    entry_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    source_type VARCHAR(20) NOT NULL,
+    source_id INTEGER NOT NULL,
+    description TEXT,
+    debit DECIMAL(14,2) NOT NULL DEFAULT 0,
+    credit DECIMAL(14,2) NOT NULL DEFAULT 0,
+    balance_after DECIMAL(14,2) NOT NULL
+);
+
+CREATE INDEX idx_ledger_entries_party_date ON ledger_entries(party_type, party_id, entry_date, id);
+
+-- Current balance per party; the row lock also serialises postings per party
+CREATE TABLE party_balances (
+    party_type ledger_party_type NOT NULL,
+    party_id INTEGER NOT NULL,
+    balance DECIMAL(14,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (party_type, party_id)
+);
+
+-- Closing balances written by compact_ledger(), so old entries can be pruned
+CREATE TABLE ledger_snapshots (
+    party_type ledger_party_type NOT NULL,
+    party_id INTEGER NOT NULL,
+    snapshot_date DATE NOT NULL,
+    balance DECIMAL(14,2) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (party_type, party_id, snapshot_date)
+);
+
+CREATE OR REPLACE FUNCTION post_ledger_entry(
+    p_party_type ledger_party_type,
+    p_party_id INTEGER,
+    p_source_type VARCHAR,
+    p_source_id INTEGER,
+    p_description TEXT,
+    p_debit DECIMAL,
+    p_credit DECIMAL,
+    p_entry_date TIMESTAMP WITH TIME ZONE DEFAULT NULL
+) RETURNS VOID AS $$
+DECLARE
+    v_balance DECIMAL;
+BEGIN
+    IF p_party_id IS NULL OR (p_debit = 0 AND p_credit = 0) THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO party_balances (party_type, party_id, balance)
+    VALUES (p_party_type, p_party_id, p_debit - p_credit)
+    ON CONFLICT (party_type, party_id) DO UPDATE SET
+        balance = party_balances.balance + EXCLUDED.balance,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING balance INTO v_balance;
+
+    -- Stamp the entry while holding the party_balances row lock: the transaction
+    -- start time could order a later balance before an earlier one
+    INSERT INTO ledger_entries (party_type, party_id, entry_date, source_type, source_id, description, debit, credit, balance_after)
+    VALUES (p_party_type, p_party_id, COALESCE(p_entry_date, clock_timestamp()), p_source_type, p_source_id,
+            p_description, p_debit, p_credit, v_balance);
+END;
+$$ language 'plpgsql';
+
+-- Invoices debit the buyer and credit the supplier; changes post the difference
+CREATE OR REPLACE FUNCTION post_invoice_to_ledger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old DECIMAL := 0;
+    v_new DECIMAL := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status <> 'cancelled' THEN
+        v_old := OLD.total_amount;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status <> 'cancelled' THEN
+        v_new := NEW.total_amount;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND OLD.buyer_id IS NOT DISTINCT FROM NEW.buyer_id
+            AND OLD.supplier_id IS NOT DISTINCT FROM NEW.supplier_id THEN
+        IF v_new <> v_old THEN
+            PERFORM post_ledger_entry('buyer', NEW.buyer_id, 'invoice', NEW.id,
+                'Invoice ' || NEW.invoice_number || ' adjusted', GREATEST(v_new - v_old, 0), GREATEST(v_old - v_new, 0));
+            PERFORM post_ledger_entry('supplier', NEW.supplier_id, 'invoice', NEW.id,
+                'Invoice ' || NEW.invoice_number || ' adjusted', GREATEST(v_old - v_new, 0), GREATEST(v_new - v_old, 0));
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    -- Insert, delete or a change of party: reverse the old posting, then post the new one
+    IF v_old <> 0 THEN
+        PERFORM post_ledger_entry('buyer', OLD.buyer_id, 'invoice', OLD.id,
+            'Invoice ' || OLD.invoice_number || ' reversed', 0, v_old);
+        PERFORM post_ledger_entry('supplier', OLD.supplier_id, 'invoice', OLD.id,
+            'Invoice ' || OLD.invoice_number || ' reversed', v_old, 0);
+    END IF;
+    IF v_new <> 0 THEN
+        PERFORM post_ledger_entry('buyer', NEW.buyer_id, 'invoice', NEW.id,
+            'Invoice ' || NEW.invoice_number, v_new, 0);
+        PERFORM post_ledger_entry('supplier', NEW.supplier_id, 'invoice', NEW.id,
+            'Invoice ' || NEW.invoice_number, 0, v_new);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER post_invoice_to_ledger_on_invoice
+    AFTER INSERT OR UPDATE OF buyer_id, supplier_id, total_amount, status OR DELETE ON invoices
+    FOR EACH ROW
+    EXECUTE FUNCTION post_invoice_to_ledger();
+
+-- Completed payments credit the buyer and debit the supplier of the paid invoice
+CREATE OR REPLACE FUNCTION post_payment_to_ledger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_invoice invoices%ROWTYPE;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' THEN
+        SELECT * INTO v_invoice FROM invoices WHERE id = OLD.invoice_id;
+        PERFORM post_ledger_entry('buyer', v_invoice.buyer_id, 'payment', OLD.id,
+            'Payment for invoice ' || v_invoice.invoice_number || ' reversed', OLD.amount, 0);
+        PERFORM post_ledger_entry('supplier', v_invoice.supplier_id, 'payment', OLD.id,
+            'Payment for invoice ' || v_invoice.invoice_number || ' reversed', 0, OLD.amount);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+        SELECT * INTO v_invoice FROM invoices WHERE id = NEW.invoice_id;
+        PERFORM post_ledger_entry('buyer', v_invoice.buyer_id, 'payment', NEW.id,
+            'Payment for invoice ' || v_invoice.invoice_number, 0, NEW.amount);
+        PERFORM post_ledger_entry('supplier', v_invoice.supplier_id, 'payment', NEW.id,
+            'Payment for invoice ' || v_invoice.invoice_number, NEW.amount, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER post_payment_to_ledger_on_payment
+    AFTER INSERT OR UPDATE OF amount, status, invoice_id OR DELETE ON payments
+    FOR EACH ROW
+    EXECUTE FUNCTION post_payment_to_ledger();
+
+-- Backfill the ledger for invoices and payments written before the triggers
+-- existed, in date order so running balances follow entry_date
+DO $$
+DECLARE
+    v_event RECORD;
+BEGIN
+    FOR v_event IN
+        SELECT * FROM (
+            SELECT 'invoice' AS source_type, i.id AS source_id, COALESCE(i.issue_date, i.created_at) AS event_date,
+                   i.buyer_id, i.supplier_id, 'Invoice ' || i.invoice_number AS description, i.total_amount AS amount
+            FROM invoices i
+            WHERE i.status <> 'cancelled'
+            UNION ALL
+            SELECT 'payment', p.id, COALESCE(p.payment_date, p.created_at),
+                   i.buyer_id, i.supplier_id, 'Payment for invoice ' || i.invoice_number, p.amount
+            FROM payments p
+            JOIN invoices i ON i.id = p.invoice_id
+            WHERE p.status = 'completed'
+        ) events
+        WHERE NOT EXISTS (
+            SELECT 1 FROM ledger_entries e
+            WHERE e.source_type = events.source_type AND e.source_id = events.source_id
+        )
+        ORDER BY event_date, source_type, source_id
+    LOOP
+        IF v_event.source_type = 'invoice' THEN
+            PERFORM post_ledger_entry('buyer', v_event.buyer_id, 'invoice', v_event.source_id,
+                v_event.description, v_event.amount, 0, v_event.event_date);
+            PERFORM post_ledger_entry('supplier', v_event.supplier_id, 'invoice', v_event.source_id,
+                v_event.description, 0, v_event.amount, v_event.event_date);
+        ELSE
+            PERFORM post_ledger_entry('buyer', v_event.buyer_id, 'payment', v_event.source_id,
+                v_event.description, 0, v_event.amount, v_event.event_date);
+            PERFORM post_ledger_entry('supplier', v_event.supplier_id, 'payment', v_event.source_id,
+                v_event.description, v_event.amount, 0, v_event.event_date);
+        END IF;
+    END LOOP;
+END;
+$$;
+
+-- Statement for one party: opening balance, entries in range and closing balance
+CREATE OR REPLACE FUNCTION ledger_statement(
+    p_party_type ledger_party_type,
+    p_party_id INTEGER,
+    p_from TIMESTAMP WITH TIME ZONE,
+    p_to TIMESTAMP WITH TIME ZONE
+) RETURNS JSON AS $$
+    WITH opening AS (
+        SELECT COALESCE(
+            (SELECT balance_after FROM ledger_entries
+             WHERE party_type = p_party_type AND party_id = p_party_id AND entry_date < p_from
+             ORDER BY entry_date DESC, id DESC LIMIT 1),
+            (SELECT balance FROM ledger_snapshots
+             WHERE party_type = p_party_type AND party_id = p_party_id AND snapshot_date <= p_from
+             ORDER BY snapshot_date DESC LIMIT 1),
+            0
+        ) AS balance
+    ),
+    entries AS (
+        SELECT * FROM ledger_entries
+        WHERE party_type = p_party_type AND party_id = p_party_id
+          AND entry_date >= p_from AND entry_date < p_to
+        ORDER BY entry_date, id
+    )
+    SELECT json_build_object(
+        'opening_balance', (SELECT balance FROM opening),
+        'closing_balance', COALESCE(
+            (SELECT balance_after FROM entries ORDER BY entry_date DESC, id DESC LIMIT 1),
+            (SELECT balance FROM opening)
+        ),
+        'entries', COALESCE((SELECT json_agg(entries ORDER BY entry_date, id) FROM entries), '[]'::json)
+    );
+$$ language 'sql' STABLE;
+
+-- Snapshot every party's closing balance before p_before; optionally prune older entries
+CREATE OR REPLACE FUNCTION compact_ledger(p_before DATE, p_prune BOOLEAN DEFAULT FALSE)
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    INSERT INTO ledger_snapshots (party_type, party_id, snapshot_date, balance)
+    SELECT DISTINCT ON (party_type, party_id) party_type, party_id, p_before, balance_after
+    FROM ledger_entries
+    WHERE entry_date < p_before
+    ORDER BY party_type, party_id, entry_date DESC, id DESC
+    ON CONFLICT (party_type, party_id, snapshot_date) DO UPDATE SET balance = EXCLUDED.balance;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    IF p_prune THEN
+        DELETE FROM ledger_entries WHERE entry_date < p_before;
+    END IF;
+    RETURN v_count;
+END;
+$$ language 'plpgsql';
+
+-- Reminder history and per-invoice cadence, so each scheduling run only picks
+-- invoices that are due another reminder. A reminder is logged as 'pending'
+-- when a run claims it and as 'sent' once the relay has accepted it.
+CREATE TABLE reminder_log (
+    id SERIAL PRIMARY KEY,
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    message_key VARCHAR(255) NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'sent' CHECK (status IN ('pending', 'sent')),
+    sent_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (invoice_id, message_key)
+);
+
+CREATE INDEX idx_reminder_log_message_key ON reminder_log(message_key);
+
+CREATE TABLE invoice_reminders (
+    invoice_id INTEGER PRIMARY KEY REFERENCES invoices(id) ON DELETE CASCADE,
+    reminder_count INTEGER NOT NULL DEFAULT 0,
+    last_sent_at TIMESTAMP WITH TIME ZONE,
+    next_due_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX idx_invoice_reminders_next_due_at ON invoice_reminders(next_due_at);
+
+-- Open overdue invoices of one buyer shard that are due a reminder
+CREATE OR REPLACE FUNCTION due_reminders(
+    p_shard INTEGER,
+    p_shards INTEGER,
+    p_as_of TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+)
+RETURNS TABLE (
+    id INTEGER,
+    invoice_number VARCHAR,
+    buyer_id INTEGER,
+    buyer_name VARCHAR,
+    buyer_email VARCHAR,
+    due_date TIMESTAMP WITH TIME ZONE,
+    total_amount DECIMAL,
+    outstanding DECIMAL
+) AS $$
+    SELECT b.invoice_id, i.invoice_number, b.buyer_id, bu.name, bu.email,
+           b.due_date, b.total_amount, b.outstanding
+    FROM invoice_balances b
+    JOIN invoices i ON i.id = b.invoice_id
+    JOIN buyers bu ON bu.id = b.buyer_id
+    LEFT JOIN invoice_reminders r ON r.invoice_id = b.invoice_id
+    WHERE b.is_open
+      AND b.outstanding > 0
+      AND b.due_date < p_as_of
+      AND b.buyer_id % p_shards = p_shard
+      AND bu.email IS NOT NULL
+      AND (r.next_due_at IS NULL OR r.next_due_at <= p_as_of)
+    ORDER BY b.buyer_id, b.due_date;
+$$ language 'sql' STABLE;
+
+-- Claim reminders before sending them (claims: [{"message_key", "invoice_ids"}]).
+-- A claim takes every invoice of its message or none: it locks their cadence
+-- rows, and only succeeds if all are still due; it then pushes next_due_at out
+-- by the lease, so concurrent or redelivered runs skip them. Returns the keys
+-- that were claimed.
+CREATE OR REPLACE FUNCTION claim_reminders(p_claims JSONB, p_lease_hours INTEGER)
+RETURNS TABLE (claimed_key VARCHAR) AS $$
+DECLARE
+    v_claim JSONB;
+    v_ids INTEGER[];
+BEGIN
+    FOR v_claim IN SELECT * FROM jsonb_array_elements(p_claims) LOOP
+        SELECT array_agg(value::INTEGER ORDER BY value::INTEGER) INTO v_ids
+        FROM jsonb_array_elements_text(v_claim->'invoice_ids');
+
+        INSERT INTO invoice_reminders (invoice_id, next_due_at)
+        SELECT unnest(v_ids), CURRENT_TIMESTAMP
+        ON CONFLICT (invoice_id) DO NOTHING;
+
+        -- A concurrent claim waits here, then sees the new next_due_at
+        PERFORM 1 FROM invoice_reminders WHERE invoice_id = ANY(v_ids) ORDER BY invoice_id FOR UPDATE;
+        IF EXISTS (
+            SELECT 1 FROM invoice_reminders
+            WHERE invoice_id = ANY(v_ids) AND next_due_at > clock_timestamp()
+        ) THEN
+            CONTINUE;
+        END IF;
+
+        UPDATE invoice_reminders SET next_due_at = clock_timestamp() + make_interval(hours => p_lease_hours)
+        WHERE invoice_id = ANY(v_ids);
+        INSERT INTO reminder_log (invoice_id, message_key, status)
+        SELECT unnest(v_ids), v_claim->>'message_key', 'pending'
+        ON CONFLICT (invoice_id, message_key) DO NOTHING;
+
+        claimed_key := v_claim->>'message_key';
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ language 'plpgsql';
+
+-- Give up claims whose message could not be sent, so the next run retries them
+CREATE OR REPLACE FUNCTION release_reminders(p_message_keys VARCHAR[])
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    WITH released AS (
+        DELETE FROM reminder_log
+        WHERE message_key = ANY(p_message_keys) AND status = 'pending'
+        RETURNING invoice_id
+    )
+    UPDATE invoice_reminders SET next_due_at = CURRENT_TIMESTAMP
+    WHERE invoice_id IN (SELECT invoice_id FROM released);
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ language 'plpgsql';
+
+-- Mark reminders sent (entries: [{"invoice_id", "message_key"}]) and schedule the
+-- next one after p_cadence_days[n] days, n being the reminders sent so far.
+-- Entries already marked sent are ignored, so recording a retried send is harmless.
+CREATE OR REPLACE FUNCTION record_reminders(p_entries JSONB, p_cadence_days INTEGER[])
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    WITH logged AS (
+        INSERT INTO reminder_log AS l (invoice_id, message_key, status)
+        SELECT (entry->>'invoice_id')::INTEGER, entry->>'message_key', 'sent'
+        FROM jsonb_array_elements(p_entries) AS entry
+        ON CONFLICT (invoice_id, message_key) DO UPDATE SET status = 'sent', sent_at = CURRENT_TIMESTAMP
+            WHERE l.status = 'pending'
+        RETURNING invoice_id
+    )
+    INSERT INTO invoice_reminders AS r (invoice_id, reminder_count, last_sent_at, next_due_at)
+    SELECT invoice_id, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP + make_interval(days => p_cadence_days[1])
+    FROM logged
+    ON CONFLICT (invoice_id) DO UPDATE SET
+        reminder_count = r.reminder_count + 1,
+        last_sent_at = CURRENT_TIMESTAMP,
+        next_due_at = CURRENT_TIMESTAMP + make_interval(
+            days => p_cadence_days[LEAST(r.reminder_count + 1, array_length(p_cadence_days, 1))]
+        );
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ language 'plpgsql';
+
+-- Record reconciled payments and update the paid invoices' status in one
+-- transaction, with the status derived from invoice_balances (kept current by
+-- the payment triggers). Payments whose transaction_id exists are skipped.
+CREATE OR REPLACE FUNCTION apply_reconciled_payments(p_payments JSONB)
+RETURNS SETOF payments AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO payments (invoice_id, amount, payment_method, status, transaction_id, payment_date, notes)
+    SELECT p.invoice_id, p.amount, p.payment_method, p.status, p.transaction_id, p.payment_date, p.notes
+    FROM jsonb_to_recordset(p_payments) AS p(
+        invoice_id INTEGER, amount DECIMAL, payment_method payment_method, status payment_status,
+        transaction_id VARCHAR, payment_date TIMESTAMP WITH TIME ZONE, notes TEXT
+    )
+    ON CONFLICT (transaction_id) DO NOTHING
+    RETURNING *;
+
+    UPDATE invoices i
+    SET status = CASE WHEN b.outstanding <= 0.005 THEN 'paid'::invoice_status ELSE 'partially_paid'::invoice_status END
+    FROM invoice_balances b
+    WHERE b.invoice_id = i.id
+      AND i.status <> 'cancelled'
+      AND b.paid_amount > 0
+      AND i.id IN (SELECT (entry->>'invoice_id')::INTEGER FROM jsonb_array_elements(p_payments) AS entry);
+END;
+$$ language 'plpgsql';
\ No newline at end of file
@@ -1,14 +1,30 @@
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import os
+import asyncio
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
+from database.pagination import KEYSET_SORT_COLUMNS, encode_cursor, keyset_filter
+from database.cache import get_invoice_cache
+from app.metrics import DB_CALL_SECONDS, instrument_methods
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Rows per bulk write request
+BULK_CHUNK_SIZE = int(os.getenv("DB_BULK_CHUNK_SIZE", 500))
+# Threads available for blocking PostgREST calls; bounds in-flight queries per process
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", 16))
+# PostgREST `db-max-rows`: the server silently truncates larger responses
+DB_MAX_ROWS = int(os.getenv("DB_MAX_ROWS", 1000))
+# Largest keyset page; one row below the cap leaves room for the has-more probe
+MAX_PAGE_SIZE = DB_MAX_ROWS - 1
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="supabase")
+
 class SupabaseClient:
     _instance = None
     _client: Optional[Client] = None
@@ -44,14 +60,34 @@ class SupabaseClient:
             self._initialize_client()
         return self._client
 
+@instrument_methods(DB_CALL_SECONDS)
 class Database:
+    """
+    Data access layer for the async routes.
+    All instances share the singleton Supabase client, and therefore one pooled
+    HTTP connection set. Queries run on a bounded thread pool so a slow
+    PostgREST call never blocks the event loop.
+    """
+
     def __init__(self):
         self.client = SupabaseClient().client
+        self.cache = get_invoice_cache()
+
+    async def _cache_rows(self, rows: List[Dict]) -> None:
+        """Refresh cached invoices with rows returned by a write."""
+        for row in rows:
+            await self.cache.set(row)
+
+    async def _execute(self, query):
+        """Run a built PostgREST query off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, query.execute)
 
     async def insert_invoice(self, invoice_data: Dict) -> Dict:
         """Insert a single invoice into the database."""
         try:
-            result = self.client.table('invoices').insert(invoice_data).execute()
+            result = await self._execute(self.client.table('invoices').insert(invoice_data))
+            await self._cache_rows(result.data)
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error inserting invoice: {str(e)}")
@@ -60,34 +96,143 @@ class Database:
     async def insert_multiple_invoices(self, invoices: List[Dict]) -> List[Dict]:
         """Insert multiple invoices into the database."""
         try:
-            result = self.client.table('invoices').insert(invoices).execute()
+            result = await self._execute(self.client.table('invoices').insert(invoices))
+            await self._cache_rows(result.data)
             return result.data
         except Exception as e:
             logger.error(f"Error inserting multiple invoices: {str(e)}")
             raise
 
+    async def upsert_invoices(
+        self,
+        invoices: List[Dict],
+        chunk_size: int = BULK_CHUNK_SIZE
+) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        Bulk insert invoices in chunks, skipping invoice numbers that already exist
+        so re-uploading a document never resets paid or edited invoices.
+        Returns (stored rows, existing, errors); `existing` holds the index, number
+        and id of each skipped row. If a chunk is rejected, its rows are retried
+        one by one so each failing row is reported with its own error.
+        """
+        stored: List[Dict] = []
+        existing: List[Dict] = []
+        errors: List[Dict] = []
+        for start in range(0, len(invoices), chunk_size):
+            chunk = invoices[start:start + chunk_size]
+            try:
+                query = self.client.table('invoices')\
+                    .upsert(chunk, on_conflict='invoice_number', ignore_duplicates=True)
+                result = await self._execute(query)
+            except Exception as e:
+                logger.warning(f"Bulk upsert of {len(chunk)} invoices failed, retrying per row: {str(e)}")
+            else:
+                await self._cache_rows(result.data)
+                stored.extend(result.data)
+                existing.extend(await self._existing_invoices(chunk, start, result.data))
+                continue
+
+            for index, row in enumerate(chunk, start):
+                try:
+                    query = self.client.table('invoices')\
+                        .upsert(row, on_conflict='invoice_number', ignore_duplicates=True)
+                    result = await self._execute(query)
+                    await self._cache_rows(result.data)
+                    stored.extend(result.data)
+                    existing.extend(await self._existing_invoices([row], index, result.data))
+                except Exception as e:
+                    logger.error(f"Error upserting invoice {row.get('invoice_number')}: {str(e)}")
+                    errors.append({
+                        "index": index,
+                        "invoice_number": row.get('invoice_number'),
+                        "error": str(e)
+                    })
+        return stored, existing, errors
+
+    async def _existing_invoices(self, rows: List[Dict], start: int, inserted: List[Dict]) -> List[Dict]:
+        """Index, number and id of the rows an ignore-duplicates insert skipped."""
+        inserted_numbers = {str(row['invoice_number']) for row in inserted}
+        skipped = [
+            (index, str(row['invoice_number'])) for index, row in enumerate(rows, start)
+            if str(row['invoice_number']) not in inserted_numbers
+        ]
+        if not skipped:
+            return []
+        result = await self._execute(
+            self.client.table('invoices').select('id, invoice_number')
+            .in_('invoice_number', [number for _, number in skipped])
+        )
+        ids = {row['invoice_number']: row['id'] for row in result.data}
+        return [
+            {"index": index, "invoice_number": number, "id": ids.get(number)}
+            for index, number in skipped
+        ]
+
+    async def replace_invoice_items(self, invoice_ids: List[int], items: List[Dict]) -> List[Dict]:
+        """
+        Replace the line items of the given invoices: one delete, then one bulk
+        insert, so re-ingesting a document does not duplicate its items.
+        """
+        try:
+            await self._execute(self.client.table('invoice_items').delete().in_('invoice_id', invoice_ids))
+            if not items:
+                return []
+            result = await self._execute(self.client.table('invoice_items').insert(items))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error storing invoice items: {str(e)}")
+            raise
+
     async def get_invoice(self, invoice_id: int) -> Optional[Dict]:
-        """Get an invoice by ID."""
+        """Get an invoice by ID, served from the invoice cache when possible."""
+        cached = await self.cache.get(invoice_id)
+        if cached is not None:
+            return cached
         try:
-            result = self.client.table('invoices').select("*").eq('id', invoice_id).execute()
+            result = await self._execute(self.client.table('invoices').select("*").eq('id', invoice_id))
+            await self._cache_rows(result.data)
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error fetching invoice: {str(e)}")
             raise
 
-    async def update_invoice(self, invoice_id: int, update_data: Dict) -> Optional[Dict]:
-        """Update an invoice."""
+    async def update_invoice(
+        self,
+        invoice_id: int,
+        update_data: Dict,
+        expected_updated_at: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Update an invoice in a single returning statement.
+        With `expected_updated_at` the update only applies if the row has not
+        changed since then. Returns None if no row matched.
+        """
         try:
-            result = self.client.table('invoices').update(update_data).eq('id', invoice_id).execute()
+            query = self.client.table('invoices').update(update_data).eq('id', invoice_id)
+            if expected_updated_at:
+                query = query.eq('updated_at', expected_updated_at)
+            result = await self._execute(query)
+            if result.data:
+                await self._cache_rows(result.data)
+            else:
+                await self.cache.invalidate(invoice_id)
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error updating invoice: {str(e)}")
             raise
 
-    async def delete_invoice(self, invoice_id: int) -> bool:
-        """Delete an invoice."""
+    async def delete_invoice(self, invoice_id: int, expected_updated_at: Optional[str] = None) -> bool:
+        """
+        Delete an invoice in a single returning statement.
+        With `expected_updated_at` the delete only applies if the row has not
+        changed since then. Returns False if no row matched.
+        """
         try:
-            result = self.client.table('invoices').delete().eq('id', invoice_id).execute()
+            query = self.client.table('invoices').delete().eq('id', invoice_id)
+            if expected_updated_at:
+                query = query.eq('updated_at', expected_updated_at)
+            result = await self._execute(query)
+            await self.cache.invalidate(invoice_id)
             return bool(result.data)
         except Exception as e:
             logger.error(f"Error deleting invoice: {str(e)}")
@@ -103,46 +248,372 @@ class Database:
                     if value is not None:
                         query = query.eq(key, value)
             
-            result = query.range(skip, skip + limit - 1).execute()
+            result = await self._execute(query.range(skip, skip + limit - 1))
             return result.data
         except Exception as e:
             logger.error(f"Error fetching invoices: {str(e)}")
             raise
 
-    async def get_overdue_invoices(self) -> List[Dict]:
-        """Get all overdue invoices."""
+    async def get_invoices_page(
+        self,
+        filters: Dict = None,
+        sort: str = "due_date",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Get one page of invoices using keyset pagination on (sort, id).
+        Returns (rows, next_cursor); next_cursor is None on the last page. Every
+        page is a bounded index range scan, however deep the cursor is.
+        `limit` is capped at MAX_PAGE_SIZE.
+        """
+        if sort not in KEYSET_SORT_COLUMNS:
+            raise ValueError(f"Cannot paginate invoices by {sort}")
+        limit = min(limit, MAX_PAGE_SIZE)
+        try:
+            columns = "*"
+            if fields:
+                # The cursor needs the sort key and id even if the caller did not ask for them
+                columns = ",".join(dict.fromkeys([*fields, sort, "id"]))
+
+            query = self.client.table('invoices').select(columns)
+            if filters:
+                for key, value in filters.items():
+                    if value is not None:
+                        query = query.eq(key, value)
+
+            after = keyset_filter(sort, cursor)
+            if after:
+                query = query.or_(after)
+            # One order param: PostgREST honours only one, so a second .order('id')
+            # would drop the tie-break the keyset filter depends on
+            order = "id" if sort == "id" else f"{sort},id"
+            # Fetch one extra row to learn whether another page exists
+            query = query.order(order).limit(limit + 1)
+
+            result = await self._execute(query)
+            rows = result.data[:limit]
+            # A response cut off at the server cap is full, even though the probe row is missing
+            has_more = len(result.data) > limit or len(result.data) >= DB_MAX_ROWS
+            next_cursor = encode_cursor(sort, rows[-1]) if has_more and rows else None
+            return rows, next_cursor
+        except Exception as e:
+            logger.error(f"Error fetching invoice page: {str(e)}")
+            raise
+
+    async def get_open_invoices(self, batch_size: int = MAX_PAGE_SIZE) -> List[Dict]:
+        """
+        Get every invoice that is not paid or cancelled, with its buyer GSTIN and
+        outstanding balance, read in keyset batches.
+        """
+        # A batch cut short by the server cap would look like the last one
+        batch_size = min(batch_size, MAX_PAGE_SIZE)
+        try:
+            invoices: List[Dict] = []
+            last_id = 0
+            while True:
+                query = self.client.table('invoices')\
+                    .select("id,invoice_number,buyer_id,total_amount,status,buyers(gst_no),invoice_balances(outstanding)")\
+                    .not_.in_('status', ['paid', 'cancelled'])\
+                    .gt('id', last_id)\
+                    .order('id')\
+                    .limit(batch_size)
+                result = await self._execute(query)
+                invoices.extend(result.data)
+                if len(result.data) < batch_size:
+                    return invoices
+                last_id = result.data[-1]['id']
+        except Exception as e:
+            logger.error(f"Error fetching open invoices: {str(e)}")
+            raise
+
+    async def get_overdue_invoices(self, fields: str = "*") -> List[Dict]:
+        """Get all overdue invoices; `fields` may embed related rows, e.g. "*, buyers(email)"."""
         try:
             from datetime import datetime
             current_date = datetime.utcnow().date().isoformat()
             
-            result = self.client.table('invoices')\
-                .select("*")\
+            query = self.client.table('invoices')\
+                .select(fields)\
                 .lt('due_date', current_date)\
-                .not_eq('status', 'paid')\
-                .execute()
+                .neq('status', 'paid')
+            result = await self._execute(query)
                 
             return result.data
         except Exception as e:
             logger.error(f"Error fetching overdue invoices: {str(e)}")
             raise
 
+    async def get_parties(self, table: str, batch_size: int = MAX_PAGE_SIZE) -> List[Dict]:
+        """Get id, name and GSTIN of every row in `buyers` or `suppliers`, read in keyset batches."""
+        batch_size = min(batch_size, MAX_PAGE_SIZE)
+        try:
+            parties: List[Dict] = []
+            last_id = 0
+            while True:
+                query = self.client.table(table)\
+                    .select("id,name,gst_no")\
+                    .gt('id', last_id)\
+                    .order('id')\
+                    .limit(batch_size)
+                result = await self._execute(query)
+                parties.extend(result.data)
+                if len(result.data) < batch_size:
+                    return parties
+                last_id = result.data[-1]['id']
+        except Exception as e:
+            logger.error(f"Error fetching {table}: {str(e)}")
+            raise
+
+    async def upsert_parties(self, table: str, parties: List[Dict], key: str = 'gst_no') -> List[Dict]:
+        """
+        Bulk insert buyers or suppliers, skipping rows whose `key` (gst_no, or
+        name_key for parties without a GSTIN) already exists so their stored
+        names and cities are kept. Returns id, name and GSTIN of every given
+        key, new or existing.
+        """
+        try:
+            query = self.client.table(table).upsert(parties, on_conflict=key, ignore_duplicates=True)
+            await self._execute(query)
+            result = await self._execute(
+                self.client.table(table).select("id,name,gst_no")
+                .in_(key, [party[key] for party in parties])
+            )
+            return result.data
+        except Exception as e:
+            logger.error(f"Error upserting {table}: {str(e)}")
+            raise
+
+    async def get_aging_report(self, group_by: str = "buyer", as_of: Optional[str] = None) -> List[Dict]:
+        """Aging buckets per party, aggregated server-side by the aging_report() function."""
+        try:
+            params = {'p_group_by': group_by}
+            if as_of:
+                params['p_as_of'] = as_of
+            result = await self._execute(self.client.rpc('aging_report', params))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error fetching aging report: {str(e)}")
+            raise
+
+    async def get_open_balances(
+        self,
+        filters: Dict = None,
+        due_from: Optional[str] = None,
+        due_to: Optional[str] = None,
+        columns: str = "*",
+        batch_size: int = MAX_PAGE_SIZE
+    ) -> List[Dict]:
+        """Get open invoice balances matching the filters, read in keyset batches."""
+        batch_size = min(batch_size, MAX_PAGE_SIZE)
+        try:
+            rows: List[Dict] = []
+            last_id = 0
+            while True:
+                query = self.client.table('invoice_balances')\
+                    .select(columns)\
+                    .eq('is_open', True)\
+                    .gt('outstanding', 0)\
+                    .gt('invoice_id', last_id)
+                if filters:
+                    for key, value in filters.items():
+                        if value is not None:
+                            query = query.eq(key, value)
+                if due_from:
+                    query = query.gte('due_date', due_from)
+                if due_to:
+                    query = query.lte('due_date', due_to)
+                result = await self._execute(query.order('invoice_id').limit(batch_size))
+                rows.extend(result.data)
+                if len(result.data) < batch_size:
+                    return rows
+                last_id = result.data[-1]['invoice_id']
+        except Exception as e:
+            logger.error(f"Error fetching open balances: {str(e)}")
+            raise
+
+    async def get_ledger_statement(
+        self,
+        party_type: str,
+        party_id: int,
+        date_from: str,
+        date_to: str
+    ) -> Dict:
+        """Opening balance, entries and closing balance for a party in one indexed range read."""
+        try:
+            result = await self._execute(self.client.rpc('ledger_statement', {
+                'p_party_type': party_type,
+                'p_party_id': party_id,
+                'p_from': date_from,
+                'p_to': date_to
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error fetching ledger statement: {str(e)}")
+            raise
+
+    async def get_party_balance(self, party_type: str, party_id: int) -> Optional[Dict]:
+        """Get the current running balance of a buyer or supplier."""
+        try:
+            query = self.client.table('party_balances')\
+                .select("*")\
+                .eq('party_type', party_type)\
+                .eq('party_id', party_id)
+            result = await self._execute(query)
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error(f"Error fetching party balance: {str(e)}")
+            raise
+
+    async def compact_ledger(self, before: str, prune: bool = False) -> int:
+        """Snapshot ledger balances before a date, optionally pruning older entries."""
+        try:
+            result = await self._execute(self.client.rpc('compact_ledger', {
+                'p_before': before,
+                'p_prune': prune
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error compacting ledger: {str(e)}")
+            raise
+
+    async def get_due_reminders(self, shard: int = 0, shards: int = 1) -> List[Dict]:
+        """Open overdue invoices of one buyer shard that are due a reminder, with buyer contact details."""
+        try:
+            result = await self._execute(self.client.rpc('due_reminders', {
+                'p_shard': shard,
+                'p_shards': shards
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error fetching due reminders: {str(e)}")
+            raise
+
+    async def claim_reminders(self, claims: List[Dict], lease_hours: int) -> set:
+        """
+        Claim reminders ({message_key, invoice_ids}) before sending them; returns
+        the keys this run may send. Keys claimed by another run are left out.
+        """
+        try:
+            result = await self._execute(self.client.rpc('claim_reminders', {
+                'p_claims': claims,
+                'p_lease_hours': lease_hours
+            }))
+            return {row['claimed_key'] for row in result.data}
+        except Exception as e:
+            logger.error(f"Error claiming reminders: {str(e)}")
+            raise
+
+    async def release_reminders(self, message_keys: List[str]) -> int:
+        """Drop the claims of reminders that could not be sent so a later run retries them."""
+        try:
+            result = await self._execute(self.client.rpc('release_reminders', {
+                'p_message_keys': message_keys
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error releasing reminders: {str(e)}")
+            raise
+
+    async def record_reminders(self, entries: List[Dict], cadence_days: List[int]) -> int:
+        """Mark reminders ({invoice_id, message_key}) sent and schedule each invoice's next one."""
+        try:
+            result = await self._execute(self.client.rpc('record_reminders', {
+                'p_entries': entries,
+                'p_cadence_days': cadence_days
+            }))
+            return result.data
+        except Exception as e:
+            logger.error(f"Error recording reminders: {str(e)}")
+            raise
+
     # Add methods for other tables (payments, suppliers, buyers, etc.)
     async def insert_payment(self, payment_data: Dict) -> Dict:
         """Insert a payment record."""
         try:
-            result = self.client.table('payments').insert(payment_data).execute()
+            result = await self._execute(self.client.table('payments').insert(payment_data))
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error inserting payment: {str(e)}")
             raise
 
+    async def apply_reconciled_payments(self, payments: List[Dict]) -> List[Dict]:
+        """
+        Insert payments (skipping existing transaction ids) and set the paid
+        invoices' status from their balances, all in one transaction.
+        Returns the inserted payments.
+        """
+        try:
+            result = await self._execute(self.client.rpc('apply_reconciled_payments', {
+                'p_payments': payments
+            }))
+            invoice_ids = list({payment['invoice_id'] for payment in payments})
+            for invoice_id in invoice_ids:
+                await self.cache.invalidate(invoice_id)
+            return result.data
+        except Exception as e:
+            logger.error(f"Error applying reconciled payments: {str(e)}")
+            raise
+
+    async def get_existing_transaction_ids(
+        self,
+        transaction_ids: List[str],
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> set:
+        """Return the subset of transaction ids that already have a payment."""
+        try:
+            existing = set()
+            for start in range(0, len(transaction_ids), chunk_size):
+                query = self.client.table('payments')\
+                    .select("transaction_id")\
+                    .in_('transaction_id', transaction_ids[start:start + chunk_size])
+                result = await self._execute(query)
+                existing.update(row['transaction_id'] for row in result.data)
+            return existing
+        except Exception as e:
+            logger.error(f"Error fetching transaction ids: {str(e)}")
+            raise
+
+    async def get_payments_by_invoices(
+        self,
+        invoice_ids: List[int],
+        chunk_size: int = BULK_CHUNK_SIZE
+    ) -> Dict[int, List[Dict]]:
+        """
+        Get payments for many invoices with `in` queries per chunk of ids, grouped
+        by invoice id. Each chunk is read in keyset batches on payment id, since
+        the server silently truncates responses at its row cap.
+        """
+        try:
+            payments: Dict[int, List[Dict]] = {invoice_id: [] for invoice_id in invoice_ids}
+            for start in range(0, len(invoice_ids), chunk_size):
+                last_id = 0
+                while True:
+                    query = self.client.table('payments')\
+                        .select("*")\
+                        .in_('invoice_id', invoice_ids[start:start + chunk_size])\
+                        .gt('id', last_id)\
+                        .order('id')\
+                        .limit(MAX_PAGE_SIZE)
+                    result = await self._execute(query)
+                    for payment in result.data:
+                        payments.setdefault(payment['invoice_id'], []).append(payment)
+                    if len(result.data) < MAX_PAGE_SIZE:
+                        break
+                    last_id = result.data[-1]['id']
+            return payments
+        except Exception as e:
+            logger.error(f"Error fetching payments: {str(e)}")
+            raise
+
     async def get_payments_by_invoice(self, invoice_id: int) -> List[Dict]:
         """Get all payments for an invoice."""
         try:
-            result = self.client.table('payments')\
+            query = self.client.table('payments')\
                 .select("*")\
-                .eq('invoice_id', invoice_id)\
-                .execute()
+                .eq('invoice_id', invoice_id)
+            result = await self._execute(query)
             return result.data
         except Exception as e:
             logger.error(f"Error fetching payments: {str(e)}")
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Header, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Optional
-import os
-import time
-from datetime import datetime
-from database.supabase import Database
-from schemas.invoice import InvoiceCreate, InvoiceUpdate, InvoiceResponse
+import json
+import asyncio
+from database.supabase import Database, MAX_PAGE_SIZE
+from database.loaders import PaymentLoader
+from schemas.invoice import InvoiceCreate, InvoiceUpdate, InvoiceResponse, InvoicePage
 from models.invoice import InvoiceStatus
-from services.gemini import process_pdf_invoice
+from services.ingestion import ingest_pdf
+from services.jobs import job_manager
+from services.export import EXPORT_FORMATS, EXPORT_EMBEDS, stream_invoices
+from services.payments import summarize_payments
 
 router = APIRouter()
 
@@ -14,6 +18,32 @@ async def get_db():
     """Dependency to get database instance."""
     return Database()
 
+async def get_payment_loader(db: Database = Depends(get_db)):
+    """Dependency giving each request its own payment batcher."""
+    return PaymentLoader(db)
+
+def _etag(invoice: dict) -> str:
+    """Invoices are versioned by their updated_at timestamp."""
+    return f'"{invoice["updated_at"]}"'
+
+def _parse_if_match(if_match: Optional[str]) -> Optional[str]:
+    """Extract the updated_at value from an If-Match header."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return value.strip('"')
+
+async def _missing_invoice_error(db: Database, invoice_id: int, expected_updated_at: Optional[str]) -> HTTPException:
+    """
+    Explain why a conditional write touched no rows. Only reached on the failure
+    path, so successful writes stay a single round-trip.
+    """
+    if expected_updated_at and await db.get_invoice(invoice_id):
+        return HTTPException(status_code=412, detail="Invoice was modified by another request")
+    return HTTPException(status_code=404, detail="Invoice not found")
+
 @router.post("/", response_model=InvoiceResponse)
 async def create_invoice(
     invoice: InvoiceCreate,
@@ -31,12 +61,14 @@ async def create_invoice(
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
 async def get_invoice(
     invoice_id: int,
+    response: Response,
     db: Database = Depends(get_db)
 ):
     """Get an invoice by ID."""
     invoice = await db.get_invoice(invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+    response.headers["ETag"] = _etag(invoice)
     return invoice
 
 @router.get("/", response_model=List[InvoiceResponse])
@@ -59,17 +91,56 @@ async def list_invoices(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/page/list", response_model=InvoicePage)
+async def list_invoices_page(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(
+        100, ge=1, le=MAX_PAGE_SIZE,
+        description="Page size; at most one below the server's row cap (DB_MAX_ROWS)"
+    ),
+    sort: str = Query("due_date", pattern="^(due_date|created_at|id)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    status: Optional[InvoiceStatus] = None,
+    buyer_id: Optional[int] = None,
+    supplier_id: Optional[int] = None,
+    include_payments: bool = Query(False, description="Add a payment summary to each invoice"),
+    db: Database = Depends(get_db),
+    payment_loader: PaymentLoader = Depends(get_payment_loader)
+):
+    """List invoices with cursor pagination and optional column projection."""
+    selected_fields = None
+    if fields:
+        selected_fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(selected_fields) - set(InvoiceResponse.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    try:
+        filters = {
+            'status': status.value if status else None,
+            'buyer_id': buyer_id,
+            'supplier_id': supplier_id
+        }
+        items, next_cursor = await db.get_invoices_page(filters, sort, cursor, limit, selected_fields)
+        if include_payments:
+            # All ids on the page resolve through one batched payments query
+            payments = await payment_loader.load_many([item['id'] for item in items])
+            for item, invoice_payments in zip(items, payments):
+                item['payment_summary'] = summarize_payments(invoice_payments)
+        return {"items": items, "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.patch("/{invoice_id}", response_model=InvoiceResponse)
 async def update_invoice(
     invoice_id: int,
     invoice: InvoiceUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Database = Depends(get_db)
 ):
-    """Update an invoice."""
-    existing_invoice = await db.get_invoice(invoice_id)
-    if not existing_invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
+    """Update an invoice; send the invoice's ETag in If-Match to reject concurrent edits."""
+    expected_updated_at = _parse_if_match(if_match)
     try:
         update_data = invoice.model_dump(exclude_unset=True)
         if 'status' in update_data:
@@ -77,28 +148,32 @@ async def update_invoice(
         if 'due_date' in update_data:
             update_data['due_date'] = update_data['due_date'].isoformat()
         
-        return await db.update_invoice(invoice_id, update_data)
+        updated = await db.update_invoice(invoice_id, update_data, expected_updated_at)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    if not updated:
+        raise await _missing_invoice_error(db, invoice_id, expected_updated_at)
+    response.headers["ETag"] = _etag(updated)
+    return updated
+
 @router.delete("/{invoice_id}")
 async def delete_invoice(
     invoice_id: int,
+    if_match: Optional[str] = Header(None),
     db: Database = Depends(get_db)
 ):
-    """Delete an invoice."""
-    existing_invoice = await db.get_invoice(invoice_id)
-    if not existing_invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
+    """Delete an invoice; send the invoice's ETag in If-Match to reject concurrent edits."""
+    expected_updated_at = _parse_if_match(if_match)
     try:
-        success = await db.delete_invoice(invoice_id)
-        if success:
-            return {"message": "Invoice deleted successfully"}
-        raise HTTPException(status_code=400, detail="Failed to delete invoice")
+        success = await db.delete_invoice(invoice_id, expected_updated_at)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    if not success:
+        raise await _missing_invoice_error(db, invoice_id, expected_updated_at)
+    return {"message": "Invoice deleted successfully"}
+
 @router.get("/overdue/list", response_model=List[InvoiceResponse])
 async def list_overdue_invoices(
     db: Database = Depends(get_db)
@@ -109,9 +184,46 @@ async def list_overdue_invoices(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/export/stream")
+async def export_invoices(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    include: Optional[str] = Query(None, description="Comma-separated relations to embed: payments, items"),
+    status: Optional[InvoiceStatus] = None,
+    buyer_id: Optional[int] = None,
+    supplier_id: Optional[int] = None,
+    db: Database = Depends(get_db)
+):
+    """Stream every matching invoice as NDJSON, CSV or Parquet without buffering the table."""
+    relations = [name.strip() for name in include.split(",") if name.strip()] if include else []
+    unknown = set(relations) - set(EXPORT_EMBEDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown relations: {', '.join(sorted(unknown))}")
+
+    filters = {
+        'status': status.value if status else None,
+        'buyer_id': buyer_id,
+        'supplier_id': supplier_id
+    }
+    try:
+        body = stream_invoices(db, format, filters, relations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="invoices.{format}"'}
+    )
+
+@router.get("/cache/stats", response_model=dict)
+async def get_cache_stats(db: Database = Depends(get_db)):
+    """Get hit/miss counters for the invoice read cache."""
+    return db.cache.stats()
+
 @router.post("/upload-pdf", response_model=dict)
 async def upload_and_process_invoice(
     pdf_file: UploadFile = File(...),
+    background: bool = Query(False, description="Queue the PDF and return a job id immediately"),
     db: Database = Depends(get_db)
 ):
     """Upload and process a PDF invoice using Gemini AI."""
@@ -119,56 +231,43 @@ async def upload_and_process_invoice(
         if not pdf_file.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="File must be a PDF")
 
-        # Save the uploaded PDF temporarily
-        temp_pdf_path = f"temp_{int(time.time())}.pdf"
-        output_folder = f"pdf_images_{int(time.time())}"
-        
-        try:
-            # Save uploaded file
-            content = await pdf_file.read()
-            with open(temp_pdf_path, "wb") as f:
-                f.write(content)
-
-            # Process the PDF
-            df, output_file = await process_pdf_invoice(temp_pdf_path, output_folder)
-            
-            # Convert results to list of dictionaries
-            results = df.to_dict(orient='records')
-            
-            # Create invoices in the database
-            created_invoices = []
-            for result in results:
-                # Map the extracted data to our invoice schema
-                invoice_data = {
-                    'invoice_number': result['invoice_number'],
-                    'buyer_id': 1,  # You'll need to implement buyer lookup/creation
-                    'supplier_id': 1,  # You'll need to implement supplier lookup/creation
-                    'amount': float(result['total_amount']) - float(result['tax_amount']),
-                    'tax_amount': float(result['tax_amount']),
-                    'total_amount': float(result['total_amount']),
-                    'status': InvoiceStatus.DRAFT.value,
-                    'due_date': datetime.strptime(result['issue_date'], "%Y-%m-%d").isoformat(),
-                    'notes': f"Processed from PDF: {pdf_file.filename}, Page: {result.get('page_number', 1)}"
-                }
-                
-                invoice = await db.insert_invoice(invoice_data)
-                created_invoices.append(invoice)
-
-            return {
+        # Process the PDF entirely in memory
+        content = await pdf_file.read()
+
+        if background:
+            try:
+                job = await job_manager.submit(content, pdf_file.filename)
+            except asyncio.QueueFull:
+                raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later")
+            return JSONResponse(status_code=202, content={
                 "success": True,
-                "message": f"Successfully processed {len(created_invoices)} invoices",
-                "invoices": created_invoices,
-                "output_file": output_file
-            }
-
-        finally:
-            # Cleanup temporary files
-            if os.path.exists(temp_pdf_path):
-                os.remove(temp_pdf_path)
-            if os.path.exists(output_folder):
-                for file in os.listdir(output_folder):
-                    os.remove(os.path.join(output_folder, file))
-                os.rmdir(output_folder)
+                "job_id": job.id,
+                "status": job.status.value
+            })
 
+        return await ingest_pdf(db, content, pdf_file.filename)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_ingestion_job(job_id: str):
+    """Get the status, progress and partial results of a PDF ingestion job."""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ingestion_job(job_id: str):
+    """Stream PDF ingestion job progress as server-sent events."""
+    if not job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for snapshot in job_manager.events(job_id):
+            yield f"data: {json.dumps(snapshot, default=str)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream") 
\ No newline at end of file
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Path
+from typing import Optional
+from datetime import datetime, timezone
+from database.supabase import Database
+from schemas.ledger import LedgerStatement, PartyBalance
+
+router = APIRouter()
+
+PARTY_TYPE_PATTERN = "^(buyer|supplier)$"
+
+async def get_db():
+    """Dependency to get database instance."""
+    return Database()
+
+@router.get("/{party_type}/{party_id}", response_model=LedgerStatement)
+async def get_ledger_statement(
+    party_id: int,
+    party_type: str = Path(..., pattern=PARTY_TYPE_PATTERN),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Database = Depends(get_db)
+):
+    """Statement of a buyer or supplier ledger for a date range."""
+    date_from = date_from or datetime(1970, 1, 1, tzinfo=timezone.utc)
+    date_to = date_to or datetime.now(timezone.utc)
+    try:
+        statement = await db.get_ledger_statement(
+            party_type, party_id, date_from.isoformat(), date_to.isoformat()
+        )
+        return {
+            "party_type": party_type,
+            "party_id": party_id,
+            "date_from": date_from,
+            "date_to": date_to,
+            **statement
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{party_type}/{party_id}/balance", response_model=PartyBalance)
+async def get_party_balance(
+    party_id: int,
+    party_type: str = Path(..., pattern=PARTY_TYPE_PATTERN),
+    db: Database = Depends(get_db)
+):
+    """Current running balance of a buyer or supplier."""
+    balance = await db.get_party_balance(party_type, party_id)
+    if not balance:
+        return {"party_type": party_type, "party_id": party_id, "balance": 0.0}
+    return balance
@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from datetime import date
+from database.supabase import Database
+from schemas.outstanding import AgingReport
+from services.outstanding import compute_aging, PARTY_COLUMNS
+
+router = APIRouter()
+
+async def get_db():
+    """Dependency to get database instance."""
+    return Database()
+
+@router.get("/aging", response_model=AgingReport)
+async def get_aging_report(
+    group_by: str = Query("buyer", pattern="^(buyer|supplier)$"),
+    as_of: Optional[date] = None,
+    db: Database = Depends(get_db)
+):
+    """Aging buckets of outstanding balances per buyer or supplier, aggregated in the database."""
+    as_of = as_of or date.today()
+    try:
+        rows = await db.get_aging_report(group_by, as_of.isoformat())
+        return {"group_by": group_by, "as_of": as_of, "rows": rows}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/aging/slice", response_model=AgingReport)
+async def get_aging_slice(
+    group_by: str = Query("buyer", pattern="^(buyer|supplier)$"),
+    as_of: Optional[date] = None,
+    buyer_id: Optional[int] = None,
+    supplier_id: Optional[int] = None,
+    due_from: Optional[date] = None,
+    due_to: Optional[date] = None,
+    db: Database = Depends(get_db)
+):
+    """Aging report over an ad-hoc slice of open balances, computed in-process."""
+    as_of = as_of or date.today()
+    try:
+        balances = await db.get_open_balances(
+            {'buyer_id': buyer_id, 'supplier_id': supplier_id},
+            due_from.isoformat() if due_from else None,
+            due_to.isoformat() if due_to else None,
+            columns=f"invoice_id,{PARTY_COLUMNS[group_by]},due_date,outstanding"
+        )
+        return {"group_by": group_by, "as_of": as_of, "rows": compute_aging(balances, group_by, as_of)}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from database.supabase import Database
+from models.payment import PaymentMethod
+from services.reconciliation import STATEMENT_DAY_FIRST, reconcile_statement
+
+router = APIRouter()
+
+async def get_db():
+    """Dependency to get database instance."""
+    return Database()
+
+@router.post("/reconcile", response_model=dict)
+async def reconcile_bank_statement(
+    statement_file: UploadFile = File(...),
+    payment_method: PaymentMethod = Query(PaymentMethod.BANK_TRANSFER),
+    dry_run: bool = Query(False, description="Match lines without writing payments"),
+    day_first: bool = Query(STATEMENT_DAY_FIRST, description="Read CSV dates like 03/04/2024 as day/month"),
+    db: Database = Depends(get_db)
+):
+    """Match a bank/UPI statement (CSV or OFX) against open invoices and record the payments."""
+    if not statement_file.filename.lower().endswith(('.csv', '.ofx', '.qfx')):
+        raise HTTPException(status_code=400, detail="File must be a CSV or OFX statement")
+    try:
+        content = await statement_file.read()
+        return await reconcile_statement(
+            db, content, statement_file.filename, payment_method, dry_run, day_first
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
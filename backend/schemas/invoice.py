@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict, Any
 from models.invoice import InvoiceStatus
 
 class InvoiceBase(BaseModel):
@@ -40,4 +40,8 @@ class InvoiceInDB(InvoiceBase):
         from_attributes = True
 
 class InvoiceResponse(InvoiceInDB):
-    pass 
\ No newline at end of file
+    pass
+
+class InvoicePage(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., description="Invoices on this page, limited to the requested fields")
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor for the next page; null on the last page") 
\ No newline at end of file
@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+class LedgerEntry(BaseModel):
+    id: int
+    entry_date: datetime
+    source_type: str = Field(..., description="invoice or payment")
+    source_id: int
+    description: Optional[str] = None
+    debit: float
+    credit: float
+    balance_after: float = Field(..., description="Running balance after this entry")
+
+class LedgerStatement(BaseModel):
+    party_type: str
+    party_id: int
+    date_from: datetime
+    date_to: datetime
+    opening_balance: float
+    closing_balance: float
+    entries: List[LedgerEntry]
+
+class PartyBalance(BaseModel):
+    party_type: str
+    party_id: int
+    balance: float
+    updated_at: Optional[datetime] = None
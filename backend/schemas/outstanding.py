@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import List, Optional
+
+class AgingReportRow(BaseModel):
+    party_id: Optional[int] = Field(None, description="Buyer or supplier ID")
+    not_due: float = Field(0.0, description="Outstanding amount not yet due")
+    days_0_30: float = Field(0.0, description="Outstanding amount 1-30 days past due")
+    days_31_60: float = Field(0.0, description="Outstanding amount 31-60 days past due")
+    days_61_90: float = Field(0.0, description="Outstanding amount 61-90 days past due")
+    days_over_90: float = Field(0.0, description="Outstanding amount more than 90 days past due")
+    total_outstanding: float = Field(0.0, description="Total outstanding amount")
+    invoice_count: int = Field(0, description="Number of open invoices")
+
+class AgingReport(BaseModel):
+    group_by: str
+    as_of: date
+    rows: List[AgingReportRow]
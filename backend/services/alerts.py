@@ -1,119 +1,137 @@
 import os
-import emails
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
 from typing import List, Dict
 from dotenv import load_dotenv
-from crud import invoice as invoice_crud
-from models.invoice import InvoiceStatus
+from database.supabase import Database
+from services.mailer import MailDelivery, OutgoingEmail, get_template
 
 load_dotenv()
 
-class EmailConfig:
-    SMTP_HOST = os.getenv("SMTP_HOST")
-    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-    SMTP_USER = os.getenv("SMTP_USER")
-    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-    EMAIL_FROM = os.getenv("EMAIL_FROM")
+logger = logging.getLogger(__name__)
 
-async def send_payment_reminder(recipient_email: str, invoice_data: Dict) -> bool:
-    """Send payment reminder email for an overdue invoice."""
-    try:
-        # Create email message
-        message = emails.Message(
-            subject=f'Payment Reminder - Invoice #{invoice_data["invoice_number"]}',
-            html=f"""
-            <h2>Payment Reminder</h2>
-            <p>Dear valued customer,</p>
-            <p>This is a reminder that payment for invoice #{invoice_data["invoice_number"]} 
-            is overdue. The invoice was due on {invoice_data["due_date"]}.</p>
-            <p>Invoice Details:</p>
-            <ul>
-                <li>Amount: ${invoice_data["total_amount"]:.2f}</li>
-                <li>Due Date: {invoice_data["due_date"]}</li>
-                <li>Days Overdue: {(datetime.now() - invoice_data["due_date"]).days}</li>
-            </ul>
-            <p>Please process the payment at your earliest convenience.</p>
-            <p>If you have already made the payment, please disregard this reminder.</p>
-            """,
-            mail_from=EmailConfig.EMAIL_FROM
-        )
-
-        # Send email
-        response = message.send(
-            to=recipient_email,
-            smtp={
-                "host": EmailConfig.SMTP_HOST,
-                "port": EmailConfig.SMTP_PORT,
-                "user": EmailConfig.SMTP_USER,
-                "password": EmailConfig.SMTP_PASSWORD,
-                "tls": True,
-            }
-        )
-
-        return response.status_code == 250
-    except Exception as e:
-        print(f"Error sending payment reminder: {str(e)}")
-        return False
+# Buyer shards a nightly run is split into; each is one Celery subtask
+REMINDER_SHARDS = int(os.getenv("REMINDER_SHARDS", 8))
+# Days until the next reminder after the 1st, 2nd, ... reminder; the last value repeats
+REMINDER_CADENCE_DAYS = [int(days) for days in os.getenv("REMINDER_CADENCE_DAYS", "3,7,14,30").split(",")]
+# Hours a claimed reminder is held back from other runs; bounds the delay after a crashed send
+REMINDER_CLAIM_HOURS = int(os.getenv("REMINDER_CLAIM_HOURS", 24))
+
+
+def _reminder_line(invoice: Dict) -> Dict:
+    due_date = datetime.fromisoformat(str(invoice["due_date"]))
+    if due_date.tzinfo is None:
+        due_date = due_date.replace(tzinfo=timezone.utc)
+    return {
+        "invoice_number": invoice["invoice_number"],
+        "amount": float(invoice.get("outstanding") or invoice["total_amount"]),
+        "due_date": due_date.date().isoformat(),
+        "days_overdue": (datetime.now(timezone.utc) - due_date).days,
+    }
 
-async def process_payment_reminders(db) -> Dict[str, int]:
+def build_payment_reminder(recipient_email: str, buyer_name: str, invoices: List[Dict]) -> OutgoingEmail:
+    """Render the payment reminder for one or more overdue invoices of a buyer."""
+    lines = [_reminder_line(invoice) for invoice in invoices]
+    if len(lines) == 1:
+        subject = f'Payment Reminder - Invoice #{lines[0]["invoice_number"]}'
+    else:
+        subject = f"Payment Reminder - {len(lines)} overdue invoices"
+    html = get_template("payment_reminder.html").render(
+        buyer_name=buyer_name,
+        invoices=lines,
+        total_amount=sum(line["amount"] for line in lines)
+    )
+    # Same invoices on the same day give the same key, so a retried run cannot send twice
+    invoice_ids = ",".join(str(invoice_id) for invoice_id in sorted(invoice["id"] for invoice in invoices))
+    digest = hashlib.sha1(invoice_ids.encode("utf-8")).hexdigest()[:16]
+    key = f"reminder.{digest}.{datetime.utcnow().date().isoformat()}"
+    return OutgoingEmail(key, recipient_email, subject, html)
+
+async def process_payment_reminders(db: Database, shard: int = 0, shards: int = 1) -> Dict[str, int]:
     """
-    Process payment reminders for overdue invoices.
+    Send payment reminders for one buyer shard: every invoice that is due a
+    reminder under the cadence, one email per buyer.
     Returns statistics about processed reminders.
     """
     stats = {
         "total_overdue": 0,
         "reminders_sent": 0,
+        "invoices_reminded": 0,
+        "claimed_elsewhere": 0,
         "errors": 0
     }
-    
+
     try:
-        # Get overdue invoices
-        overdue_invoices = await invoice_crud.get_overdue_invoices(db)
-        stats["total_overdue"] = len(overdue_invoices)
-        
-        for invoice in overdue_invoices:
-            try:
-                # Get buyer email from buyer details
-                # Note: This assumes buyer email is stored in the invoice or can be retrieved
-                buyer_email = invoice["buyer_details"]["email"]  # Adjust according to your data structure
-                
-                # Send reminder
-                success = await send_payment_reminder(buyer_email, invoice)
-                
-                if success:
-                    stats["reminders_sent"] += 1
-                else:
-                    stats["errors"] += 1
-                    
-            except Exception as e:
-                print(f"Error processing reminder for invoice {invoice['id']}: {str(e)}")
-                stats["errors"] += 1
-                
+        # Only invoices whose next reminder is due, with the buyer's contact details
+        due_invoices = await db.get_due_reminders(shard, shards)
+        stats["total_overdue"] = len(due_invoices)
+
+        by_buyer: Dict[int, List[Dict]] = defaultdict(list)
+        for invoice in due_invoices:
+            by_buyer[invoice["buyer_id"]].append(invoice)
+        messages = {}
+        for invoices in by_buyer.values():
+            message = build_payment_reminder(invoices[0]["buyer_email"], invoices[0]["buyer_name"], invoices)
+            messages[message.key] = (message, invoices)
+
+        # Claimed before sending, so a concurrent or redelivered run skips them
+        claimed = await db.claim_reminders([
+            {"message_key": key, "invoice_ids": [invoice["id"] for invoice in invoices]}
+            for key, (_, invoices) in messages.items()
+        ], REMINDER_CLAIM_HOURS) if messages else set()
+        stats["claimed_elsewhere"] = len(messages) - len(claimed)
+
+        async def record(message: OutgoingEmail) -> None:
+            # Logged right after the relay accepts it, so a crash later in the
+            # shard cannot cause a redelivered task to send it again
+            entries = [{"invoice_id": invoice["id"], "message_key": message.key} for invoice in messages[message.key][1]]
+            await db.record_reminders(entries, REMINDER_CADENCE_DAYS)
+
+        delivery = MailDelivery()
+        try:
+            outcome = await delivery.send_all(
+                [message for key, (message, _) in messages.items() if key in claimed], on_sent=record
+            )
+        finally:
+            await delivery.close()
+        if outcome["failed"]:
+            await db.release_reminders(outcome["failed"])
+
+        stats["reminders_sent"] = len(outcome["sent"])
+        stats["invoices_reminded"] = sum(len(messages[key][1]) for key in outcome["sent"])
+        stats["errors"] += len(outcome["failed"])
+        logger.info(f"Reminder shard {shard}/{shards} completed: {stats}")
         return stats
-        
+
     except Exception as e:
-        print(f"Error in payment reminder processing: {str(e)}")
-        return stats
+        # Raised so the task is retried; claims keep the retry from re-sending
+        logger.error(f"Error in payment reminder processing for shard {shard}/{shards}: {str(e)}")
+        raise
 
 # Celery task for scheduled reminders
-from celery import Celery
-from app.database import get_database
+from celery import Celery, group
+from celery.schedules import crontab
 
-celery_app = Celery('tasks', broker=os.getenv("REDIS_URL"))
+celery_app = Celery('tasks', broker=os.getenv("REDIS_URL"), include=['services.ledger'])
 
 @celery_app.task
 def schedule_payment_reminders():
-    """Celery task to schedule payment reminders."""
-    try:
-        # Get database connection
-        db = get_database().client
-        
-        # Process reminders
-        stats = process_payment_reminders(db)
-        
-        print(f"Payment reminder processing completed: {stats}")
-        return stats
-        
-    except Exception as e:
-        print(f"Error in scheduled payment reminders: {str(e)}")
-        return {"error": str(e)} 
\ No newline at end of file
+    """Celery task fanning the reminder run out as one subtask per buyer shard."""
+    result = group(
+        send_reminder_shard.s(shard, REMINDER_SHARDS) for shard in range(REMINDER_SHARDS)
+    ).apply_async()
+    logger.info(f"Scheduled payment reminders across {REMINDER_SHARDS} shards")
+    return {"shards": REMINDER_SHARDS, "group_id": result.id}
+
+@celery_app.task(acks_late=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def send_reminder_shard(shard: int, shards: int):
+    """Celery task sending the reminders of one buyer shard."""
+    return asyncio.run(process_payment_reminders(Database(), shard, shards))
+
+celery_app.conf.beat_schedule["send-payment-reminders"] = {
+    "task": schedule_payment_reminders.name,
+    "schedule": crontab(hour=1, minute=0),
+}
\ No newline at end of file
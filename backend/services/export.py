@@ -0,0 +1,167 @@
+import io
+import csv
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+from database.supabase import Database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Related tables that can be embedded in each exported invoice
+EXPORT_EMBEDS = {
+    "payments": "payments(*)",
+    "items": "invoice_items(*)",
+}
+# Kept well below the PostgREST row cap so every keyset page can signal a next one
+EXPORT_BATCH_SIZE = 500
+# Parquet column kinds of the invoices table; other columns (embeds) are written as strings
+INVOICE_COLUMN_KINDS = {
+    "id": "integer",
+    "buyer_id": "integer",
+    "supplier_id": "integer",
+    "amount": "decimal",
+    "tax_amount": "decimal",
+    "total_amount": "decimal",
+    "due_date": "timestamp",
+    "issue_date": "timestamp",
+    "created_at": "timestamp",
+    "updated_at": "timestamp",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands buffered bytes back to the caller on demand."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _flatten(row: Dict) -> Dict:
+    """Serialise embedded relations so every export row has scalar columns only."""
+    return {
+        key: json.dumps(value, default=str) if isinstance(value, (list, dict)) else value
+        for key, value in row.items()
+    }
+
+
+async def iter_invoice_batches(
+    db: Database,
+    filters: Optional[Dict] = None,
+    include: Optional[List[str]] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[List[Dict]]:
+    """Walk the invoices table in id order with keyset scans, one batch at a time."""
+    fields = ["*"] + [EXPORT_EMBEDS[name] for name in include or []]
+    cursor = None
+    while True:
+        rows, cursor = await db.get_invoices_page(filters, "id", cursor, batch_size, fields)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+async def _stream_ndjson(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in rows).encode("utf-8")
+
+
+async def _stream_csv(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[bytes]:
+    writer = None
+    buffer = io.StringIO()
+    async for rows in batches:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0]), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerows(_flatten(row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _parquet_value(kind: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "integer":
+        return int(value)
+    if kind == "decimal":
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    if kind == "timestamp":
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return str(value)
+
+
+async def _stream_parquet(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {
+        "integer": pa.int64(),
+        "decimal": pa.decimal128(12, 2),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+    }
+    sink = _ChunkSink()
+    writer = None
+    async for rows in batches:
+        flat = [_flatten(row) for row in rows]
+        if writer is None:
+            # Fixed from the table's column types, so the schema cannot drift between batches
+            kinds = {name: INVOICE_COLUMN_KINDS.get(name, "string") for name in flat[0]}
+            schema = pa.schema([(name, arrow_types[kind]) for name, kind in kinds.items()])
+            writer = pq.ParquetWriter(sink, schema)
+        table = pa.Table.from_pylist(
+            [{name: _parquet_value(kind, row.get(name)) for name, kind in kinds.items()} for row in flat],
+            schema=schema
+        )
+        writer.write_table(table)  # each batch becomes one row group
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def check_export_format(fmt: str) -> None:
+    """Raise ValueError if `fmt` is unknown or its optional dependency is missing."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export requires the pyarrow package")
+
+
+def stream_invoices(
+    db: Database,
+    fmt: str,
+    filters: Optional[Dict] = None,
+    include: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """Stream all matching invoices in `fmt`, holding only one batch in memory."""
+    check_export_format(fmt)
+    batches = iter_invoice_batches(db, filters, include)
+    if fmt == "csv":
+        return _stream_csv(batches)
+    if fmt == "parquet":
+        return _stream_parquet(batches)
+    return _stream_ndjson(batches)
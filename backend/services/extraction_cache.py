@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from app.metrics import EXTRACTION_CACHE_LOOKUPS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_BACKEND = os.getenv("EXTRACTION_CACHE_BACKEND", "sqlite")
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "extraction_cache.sqlite3")
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", 30 * 24 * 3600))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 100_000))
+
+
+def make_cache_key(image_bytes: bytes, prompt_version: str) -> str:
+    """Content-address a rendered page: identical pages under the same prompt share a key."""
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """Storage interface for extraction results."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict]:
+        """Return the cached value for `key`, or None if absent or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict) -> None:
+        """Store `value` under `key`."""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Local on-disk cache with TTL expiry and least-recently-used eviction."""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extraction_cache_accessed_at "
+            "ON extraction_cache(accessed_at)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            # Drop expired rows, then evict least recently used entries over the limit
+            self._conn.execute("DELETE FROM extraction_cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                """DELETE FROM extraction_cache WHERE key IN (
+                    SELECT key FROM extraction_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Dict) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache in Redis; expiry via TTL, eviction via the server's maxmemory policy."""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "extraction:"):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        value = await self._client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Dict) -> None:
+        await self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+
+class ExtractionCache:
+    """Cache in front of the extraction model, with hit/miss counters."""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Dict]:
+        if self.backend is None:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Error reading extraction cache: {str(e)}")
+            value = None
+        if value is None:
+            self.misses += 1
+            EXTRACTION_CACHE_LOOKUPS.labels("miss").inc()
+        else:
+            self.hits += 1
+            EXTRACTION_CACHE_LOOKUPS.labels("hit").inc()
+        return value
+
+    async def set(self, key: str, value: Dict) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(key, value)
+        except Exception as e:
+            logger.error(f"Error writing extraction cache: {str(e)}")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@lru_cache()
+def get_extraction_cache() -> ExtractionCache:
+    """Get the process-wide extraction cache configured from the environment."""
+    if EXTRACTION_CACHE_BACKEND == "redis":
+        backend = RedisCacheBackend(os.getenv("REDIS_URL"), EXTRACTION_CACHE_TTL)
+    elif EXTRACTION_CACHE_BACKEND == "sqlite":
+        backend = SQLiteCacheBackend(
+            EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_TTL, EXTRACTION_CACHE_MAX_ENTRIES
+        )
+    else:
+        backend = None
+    logger.info(f"Extraction cache backend: {EXTRACTION_CACHE_BACKEND}")
+    return ExtractionCache(backend)
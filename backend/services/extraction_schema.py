@@ -0,0 +1,221 @@
+import json
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+
+class LineItem(BaseModel):
+    description: str = Field(min_length=1)
+    quantity: Optional[float] = None
+    rate: Optional[float] = None
+
+
+class InvoiceExtraction(BaseModel):
+    """One invoice page as returned by structured-output extraction."""
+    invoice_number: str = Field(min_length=1)
+    issue_date: date
+    seller: Optional[str] = None
+    seller_gst_no: Optional[str] = None
+    client: Optional[str] = None
+    client_gst_no: Optional[str] = None
+    client_city: Optional[str] = None
+    transport: Optional[str] = None
+    lr_no: Optional[str] = None
+    line_items: List[LineItem] = []
+    discount: Optional[float] = None
+    tax_amount: Optional[float] = None
+    total_amount: float
+
+
+# Built once: validation runs straight from the JSON text in pydantic-core
+invoice_adapter = TypeAdapter(InvoiceExtraction)
+
+
+def _field(type_: str, description: str, nullable: bool = True) -> Dict:
+    return {"type": type_, "description": description, "nullable": nullable}
+
+
+# Hand-written in the OpenAPI subset Gemini accepts (no $defs/anyOf as pydantic would emit)
+INVOICE_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "invoice_number": _field("STRING", "Invoice number / bill no.", nullable=False),
+        "issue_date": _field("STRING", "Invoice date formatted as YYYY-MM-DD", nullable=False),
+        "seller": _field("STRING", "Name of the seller issuing the invoice"),
+        "seller_gst_no": _field("STRING", "GSTIN of the seller"),
+        "client": _field("STRING", "Name of the client (buyer)"),
+        "client_gst_no": _field("STRING", "GSTIN of the client"),
+        "client_city": _field("STRING", "City name / area of the client"),
+        "transport": _field("STRING", "Transport name"),
+        "lr_no": _field("STRING", "LR. No. (lorry receipt number)"),
+        "line_items": {
+            "type": "ARRAY",
+            "description": "Every goods line in the items table, in order",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "description": _field("STRING", "Description of goods", nullable=False),
+                    "quantity": _field("NUMBER", "Quantity"),
+                    "rate": _field("NUMBER", "Rate per unit"),
+                },
+                "required": ["description", "quantity", "rate"],
+            },
+        },
+        "discount": _field("NUMBER", "Less / discount amount"),
+        "tax_amount": _field("NUMBER", "Total GST amount"),
+        "total_amount": _field("NUMBER", "Total invoice amount", nullable=False),
+    },
+}
+INVOICE_RESPONSE_SCHEMA["required"] = list(INVOICE_RESPONSE_SCHEMA["properties"])
+INVOICE_FIELDS = tuple(INVOICE_RESPONSE_SCHEMA["properties"])
+
+
+class ExtractionSpec:
+    """A versioned prompt together with the response schema it is paired with."""
+
+    def __init__(self, version: str, prompt: str, batch_prompt: str, response_schema: Dict):
+        self.version = version
+        self.prompt = prompt
+        self.batch_prompt = batch_prompt
+        self.response_schema = response_schema
+
+    def schema_for(self, fields: Optional[List[str]] = None) -> Dict:
+        """The response schema, optionally narrowed to `fields` for a re-ask."""
+        if not fields:
+            return self.response_schema
+        properties = self.response_schema["properties"]
+        return {
+            "type": "OBJECT",
+            "properties": {name: properties[name] for name in fields},
+            "required": list(fields),
+        }
+
+    def batch_schema(self) -> Dict:
+        """Schema for a multi-page request: one page-labelled invoice per page."""
+        schema = self.response_schema
+        return {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "page_number": _field("INTEGER", "Label of the page this invoice is on", nullable=False),
+                    **schema["properties"],
+                },
+                "required": ["page_number"] + schema["required"],
+            },
+        }
+
+    def reask_prompt(self, fields: List[str]) -> str:
+        return (
+            f"{self.prompt}\n"
+            f"An earlier answer for this page had missing or invalid values. "
+            f"Read the page again and return only these fields: {', '.join(fields)}."
+        )
+
+
+INVOICE_PROMPT_V2 = """Extract the invoice on this page.
+Return every goods line of the items table as one entry in line_items with its description, quantity and rate.
+Write issue_date as YYYY-MM-DD.
+Write amounts as plain numbers, without currency symbols or thousands separators.
+Use null for any field that is not present on the page."""
+
+INVOICE_BATCH_PROMPT_V2 = """Each image above is one page, preceded by its page label.
+Return exactly one entry per page, with page_number set to that page's label.
+For each page: return every goods line of the items table as one entry in line_items with its description, quantity and rate.
+Write issue_date as YYYY-MM-DD.
+Write amounts as plain numbers, without currency symbols or thousands separators.
+Use null for any field that is not present on the page."""
+
+# Bump the version whenever a prompt or schema changes, so cached extractions are not reused
+PROMPT_REGISTRY: Dict[str, ExtractionSpec] = {
+    "v2": ExtractionSpec("v2", INVOICE_PROMPT_V2, INVOICE_BATCH_PROMPT_V2, INVOICE_RESPONSE_SCHEMA),
+}
+DEFAULT_PROMPT_VERSION = "v2"
+
+
+def get_extraction_spec(version: str) -> ExtractionSpec:
+    try:
+        return PROMPT_REGISTRY[version]
+    except KeyError:
+        raise ValueError(f"Unknown extraction prompt version: {version}")
+
+
+def parse_extraction(
+    text: str,
+    previous: Optional[Dict] = None
+) -> Tuple[Optional[InvoiceExtraction], Dict, List[str]]:
+    """
+    Validate a model response, merged over the fields of an earlier attempt.
+    Returns (extraction, raw fields, names of fields that failed validation);
+    extraction is None when any field failed.
+    """
+    if previous is None:
+        try:
+            return invoice_adapter.validate_json(text), {}, []
+        except ValidationError:
+            pass  # fall through to find out which fields failed
+
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        answer = None
+    if not isinstance(answer, dict):
+        return None, dict(previous or {}), list(INVOICE_FIELDS)
+
+    data = {**(previous or {}), **answer}
+    try:
+        return invoice_adapter.validate_python(data), data, []
+    except ValidationError as e:
+        failed = {str(error["loc"][0]) for error in e.errors() if error["loc"]}
+        return None, data, [name for name in INVOICE_FIELDS if name in failed] or list(INVOICE_FIELDS)
+
+
+def parse_batch_extraction(text: str) -> Dict[int, Optional[InvoiceExtraction]]:
+    """
+    Validate a multi-page response into {page_number: extraction}; pages whose
+    entry failed validation map to None. Raises ValueError if the response is
+    not a JSON array (e.g. it was truncated at the output token limit).
+    """
+    entries = json.loads(text)
+    if not isinstance(entries, list):
+        raise ValueError("Batch response is not a JSON array")
+
+    extractions: Dict[int, Optional[InvoiceExtraction]] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        fields = dict(entry)
+        try:
+            page_number = int(fields.pop("page_number"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        try:
+            extractions[page_number] = invoice_adapter.validate_python(fields)
+        except ValidationError:
+            extractions[page_number] = None
+    return extractions
+
+
+def to_invoice_data(extraction: InvoiceExtraction) -> Dict:
+    """Map a validated extraction to the invoice dict used by ingestion."""
+    items = extraction.line_items
+    return {
+        "invoice_number": extraction.invoice_number,
+        "issue_date": extraction.issue_date.isoformat(),
+        "supplier_details": {
+            "name": extraction.seller,
+            "gst_no": extraction.seller_gst_no
+        },
+        "buyer_details": {
+            "name": extraction.client,
+            "gst_no": extraction.client_gst_no,
+            "city": extraction.client_city
+        },
+        "items": [item.description for item in items],
+        "quantities": [item.quantity for item in items],
+        "rates": [item.rate for item in items],
+        "line_items": [item.model_dump() for item in items],
+        "discount": extraction.discount or 0,
+        "tax_amount": extraction.tax_amount or 0,
+        "total_amount": extraction.total_amount
+    }
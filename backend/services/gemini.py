@@ -1,187 +1,555 @@
-import os
-import google.generativeai as genai
-import fitz  # PyMuPDF
-import base64
-import json
-import time
-import logging
-from datetime import datetime
-from typing import Dict, Optional, List, Tuple
-import pandas as pd
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    filename=f'bill_processing_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Configure Gemini API
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("Please set the GOOGLE_API_KEY environment variable.")
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-async def pdf_to_images(pdf_path: str, output_folder: str, zoom: int = 3) -> List[str]:
-    """Convert PDF pages to images."""
-    try:
-        logging.info(f"Starting PDF to image conversion for file: {pdf_path}")
-        os.makedirs(output_folder, exist_ok=True)
-        
-        image_paths = []
-        pdf_document = fitz.open(pdf_path)
-        
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
-            
-            output_path = os.path.join(output_folder, f"page_{page_num + 1}.jpg")
-            pix.save(output_path, "jpeg")
-            image_paths.append(output_path)
-            logging.info(f"Processed and saved page {page_num + 1}")
-            
-        pdf_document.close()
-        return image_paths
-        
-    except Exception as e:
-        logging.error(f"Error in pdf_to_images: {str(e)}")
-        raise
-
-async def extract_invoice_data(image_path: str) -> Optional[Dict]:
-    """Extract invoice data from an image using Gemini API."""
-    try:
-        logging.info(f"Processing image: {image_path}")
-        
-        with open(image_path, 'rb') as image_file:
-            image_content = image_file.read()
-        
-        prompt = """From the following context: fill the given template fields.
-            Template : What is the ["Date",
-                "Seller",
-                "Seller Gst No.",
-                "Client",
-                "Invoice Number / Bill No.",
-                "Transport",
-                "LR. No.",
-                "Clinet Gst No.",
-                "City Name / Area of the Client",
-                "Items or Desciption of Goods Details",
-                "Quantity"
-                "Rate of Goods",
-                "Less / Discount Amount"
-                "Total Gst Amount",
-                "Total Amount"]?
-            Add all the goods that are present in the table with comma seperator. All add the rate of goods with comma seperator.
-            The output should be in json foramt.
-            Provide only the field name and its answer, if the answer is not present in the context answer "NAN" for that field."""
-        
-        response = model.generate_content([
-            {
-                'mime_type': 'image/jpeg',
-                'data': base64.b64encode(image_content).decode('utf-8')
-            },
-            prompt
-        ])
-        
-        # Clean and parse response
-        cleaned_response = response.text.replace("```json", "").replace("```", "").strip()
-        result = json.loads(cleaned_response)
-        
-        # Map the extracted fields to our invoice schema
-        mapped_data = {
-            "invoice_number": result.get("Invoice Number / Bill No.", ""),
-            "issue_date": result.get("Date", datetime.now().strftime("%d/%m/%Y")),
-            "supplier_details": {
-                "name": result.get("Seller", ""),
-                "gst_no": result.get("Seller Gst No.", "")
-            },
-            "buyer_details": {
-                "name": result.get("Client", ""),
-                "gst_no": result.get("Clinet Gst No.", ""),
-                "city": result.get("City Name / Area of the Client", "")
-            },
-            "items": result.get("Items or Desciption of Goods Details", "").split(","),
-            "quantities": result.get("Quantity", "").split(","),
-            "rates": result.get("Rate of Goods", "").split(","),
-            "discount": result.get("Less / Discount Amount", 0),
-            "tax_amount": result.get("Total Gst Amount", 0),
-            "total_amount": result.get("Total Amount", 0)
-        }
-        
-        return mapped_data
-        
-    except Exception as e:
-        logging.error(f"Error extracting invoice data: {str(e)}")
-        return None
-
-async def process_pdf_invoice(pdf_path: str, output_folder: str) -> Tuple[pd.DataFrame, str]:
-    """Process a PDF invoice and extract data from all pages."""
-    try:
-        # Convert PDF to images
-        image_paths = await pdf_to_images(pdf_path, output_folder)
-        
-        # Extract data from each image
-        all_results = []
-        for idx, image_path in enumerate(image_paths, 1):
-            result = await extract_invoice_data(image_path)
-            if result:
-                result['page_number'] = idx
-                all_results.append(result)
-            time.sleep(2)  # Rate limiting
-            
-        # Create DataFrame
-        df = pd.DataFrame(all_results)
-        
-        # Save results
-        output_file = f"invoice_details_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df.to_csv(output_file, index=False)
-        
-        return df, output_file
-        
-    except Exception as e:
-        logging.error(f"Error processing PDF invoice: {str(e)}")
-        raise
-
-async def validate_extracted_data(data: Dict) -> bool:
-    """
-    Validate the extracted invoice data.
-    Returns True if data is valid, False otherwise.
-    """
-    required_fields = [
-        "invoice_number",
-        "issue_date",
-        "due_date",
-        "total_amount"
-    ]
-    
-    try:
-        # Check required fields
-        for field in required_fields:
-            if not data.get(field):
-                print(f"Missing required field: {field}")
-                return False
-        
-        # Validate amounts
-        if data["total_amount"] <= 0:
-            print("Invalid total amount")
-            return False
-            
-        if data["tax_amount"] < 0:
-            print("Invalid tax amount")
-            return False
-            
-        # Validate dates
-        if data["due_date"] < data["issue_date"]:
-            print("Due date cannot be earlier than issue date")
-            return False
-            
-        return True
-        
-    except Exception as e:
-        print(f"Error validating data: {str(e)}")
+import os
+import time
+import uuid
+import asyncio
+import base64
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING, Dict, Optional, List, Tuple, Iterable, AsyncIterable, AsyncIterator, Union, Callable, Awaitable
+)
+from dotenv import load_dotenv
+from services.rate_limiter import AsyncRateLimiter
+from services.extraction_cache import get_extraction_cache, make_cache_key
+from pydantic import ValidationError
+from services.extraction_schema import (
+    DEFAULT_PROMPT_VERSION, PROMPT_REGISTRY, ExtractionSpec, InvoiceExtraction, get_extraction_spec, invoice_adapter,
+    parse_extraction, parse_batch_extraction, to_invoice_data
+)
+from services.text_layer import TextPage, classify_pages, find_template
+from services.rendering import RENDER_FORMAT, image_mime_type, render_pages
+from app.metrics import GEMINI_REQUEST_SECONDS, GEMINI_RETRIES, GEMINI_TOKENS, RENDER_SECONDS
+
+if TYPE_CHECKING:
+    # The ingestion stack is imported on first use, so API workers that never
+    # handle a PDF do not pay for it
+    import pandas as pd
+    import google.generativeai as genai
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+
+# Concurrency and quota settings for Gemini calls
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", 30))
+GEMINI_TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TOKENS_PER_MINUTE", 1_000_000))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+# Prompt and response schema come from the versioned registry in services.extraction_schema
+PROMPT_VERSION = os.getenv("EXTRACTION_PROMPT_VERSION", DEFAULT_PROMPT_VERSION)
+# Follow-up requests for fields that failed validation, before a page is given up
+EXTRACTION_REASK_ATTEMPTS = int(os.getenv("EXTRACTION_REASK_ATTEMPTS", 1))
+# Rough input+output token cost of one page request, used to pace the TPM quota
+ESTIMATED_TOKENS_PER_PAGE = 2000
+# Upper bound on pages packed into one request (1 disables batching) and the model's token limits
+GEMINI_PAGES_PER_REQUEST = int(os.getenv("GEMINI_PAGES_PER_REQUEST", 1))
+GEMINI_MAX_INPUT_TOKENS = int(os.getenv("GEMINI_MAX_INPUT_TOKENS", 1_000_000))
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", 8192))
+# Directory for a CSV copy of each document's extraction; empty disables the export
+EXTRACTION_CSV_DIR = os.getenv("EXTRACTION_CSV_DIR", "")
+
+rate_limiter = AsyncRateLimiter(GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE)
+
+
+class PageBatchSizer:
+    """
+    Chooses how many pages to pack into one request so the expected input and
+    output stay within the model limits. Per-page token costs start from rough
+    guesses and follow the usage reported by completed requests.
+    """
+
+    # Fraction of each limit a batch may plan to use
+    HEADROOM = 0.8
+    # Weight of the newest observation in the running per-page averages
+    SMOOTHING = 0.3
+
+    def __init__(
+        self,
+        max_pages: int,
+        max_input_tokens: int,
+        max_output_tokens: int,
+        input_tokens_per_page: float = 1500,
+        output_tokens_per_page: float = 700
+    ):
+        self.max_pages = max(1, max_pages)
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.input_tokens_per_page = input_tokens_per_page
+        self.output_tokens_per_page = output_tokens_per_page
+
+    def size(self) -> int:
+        by_input = int(self.max_input_tokens * self.HEADROOM // self.input_tokens_per_page)
+        by_output = int(self.max_output_tokens * self.HEADROOM // self.output_tokens_per_page)
+        return max(1, min(self.max_pages, by_input, by_output))
+
+    def record(self, pages: int, usage) -> None:
+        """Fold the usage metadata of a `pages`-page response into the averages."""
+        if usage is None or pages <= 0:
+            return
+        self.input_tokens_per_page += self.SMOOTHING * (
+            usage.prompt_token_count / pages - self.input_tokens_per_page
+        )
+        self.output_tokens_per_page += self.SMOOTHING * (
+            usage.candidates_token_count / pages - self.output_tokens_per_page
+        )
+
+
+batch_sizer = PageBatchSizer(GEMINI_PAGES_PER_REQUEST, GEMINI_MAX_INPUT_TOKENS, GEMINI_MAX_OUTPUT_TOKENS)
+
+def validate_config() -> List[str]:
+    """Describe problems with the extraction settings, reading only the environment."""
+    problems = []
+    if not os.getenv("GOOGLE_API_KEY"):
+        problems.append("GOOGLE_API_KEY is not set; PDF extraction will fail")
+    if PROMPT_VERSION not in PROMPT_REGISTRY:
+        problems.append(f"Unknown extraction prompt version: {PROMPT_VERSION}")
+    return problems
+
+@lru_cache()
+def get_model() -> "genai.GenerativeModel":
+    """Configure the Gemini client on first use."""
+    import google.generativeai as genai
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("Please set the GOOGLE_API_KEY environment variable.")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+def _spec() -> ExtractionSpec:
+    return get_extraction_spec(PROMPT_VERSION)
+
+async def pdf_to_images(pdf_path: str, output_folder: str, zoom: Optional[float] = None) -> List[str]:
+    """Convert PDF pages to images, rendered in parallel by the render pool."""
+    try:
+        logger.info(f"Starting PDF to image conversion for file: {pdf_path}")
+        os.makedirs(output_folder, exist_ok=True)
+
+        with open(pdf_path, 'rb') as pdf_file:
+            pdf_bytes = pdf_file.read()
+
+        image_paths = []
+        extension = "webp" if RENDER_FORMAT == "webp" else "jpg"
+        started = time.perf_counter()
+        async for page_number, image_bytes in render_pdf_pages(pdf_bytes, zoom):
+            output_path = os.path.join(output_folder, f"page_{page_number}.{extension}")
+            with open(output_path, 'wb') as image_file:
+                image_file.write(image_bytes)
+            image_paths.append(output_path)
+            logger.info(f"Processed and saved page {page_number}")
+
+        RENDER_SECONDS.labels("pdf_to_images").observe(time.perf_counter() - started)
+        return image_paths
+        
+    except Exception as e:
+        logger.error(f"Error in pdf_to_images: {str(e)}")
+        raise
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """Return the number of pages in an in-memory PDF without rendering it."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        return len(pdf_document)
+
+def render_pdf_pages(
+    pdf_bytes: bytes,
+    zoom: Optional[float] = None,
+    page_numbers: Optional[Iterable[int]] = None
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Render PDF pages to encoded images in memory, off the event loop.
+    Yields (page_number, image_bytes) in page order while later pages are still
+    rendering in the pool. `page_numbers` (1-based) limits rendering to those
+    pages; `zoom` defaults to one chosen per page from the pixel budget.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, count_pdf_pages(pdf_bytes) + 1)
+    return render_pages(pdf_bytes, list(page_numbers), zoom)
+
+def _structured_config(fields: Optional[List[str]] = None, batch: bool = False) -> "genai.GenerationConfig":
+    """Ask for JSON matching the active response schema (or just `fields` of it)."""
+    import google.generativeai as genai
+
+    return genai.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=_spec().batch_schema() if batch else _spec().schema_for(fields)
+    )
+
+async def _generate_content(
+    contents: List,
+    generation_config: Optional["genai.GenerationConfig"] = None,
+    estimated_tokens: int = ESTIMATED_TOKENS_PER_PAGE,
+    kind: str = "page"
+):
+    """
+    Call Gemini under the shared rate limiter, retrying with backoff on 429s.
+    `kind` labels the call (page, text, batch, reask) in the metrics.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    model = get_model()
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await rate_limiter.acquire(estimated_tokens)
+        started = time.perf_counter()
+        try:
+            response = await model.generate_content_async(contents, generation_config=generation_config)
+        except google_exceptions.ResourceExhausted:
+            GEMINI_REQUEST_SECONDS.labels(kind, "rate_limited").observe(time.perf_counter() - started)
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            GEMINI_RETRIES.labels(kind).inc()
+            # The limiter holds back every caller until the backoff expires
+            rate_limiter.backoff()
+            continue
+        except Exception:
+            GEMINI_REQUEST_SECONDS.labels(kind, "error").observe(time.perf_counter() - started)
+            raise
+        GEMINI_REQUEST_SECONDS.labels(kind, "success").observe(time.perf_counter() - started)
+
+        rate_limiter.reset_backoff()
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            rate_limiter.record_usage(estimated_tokens, usage.total_token_count)
+            GEMINI_TOKENS.labels(kind, "prompt").inc(usage.prompt_token_count)
+            GEMINI_TOKENS.labels(kind, "output").inc(usage.candidates_token_count)
+        return response
+
+def _read_image(image: Union[str, bytes]) -> bytes:
+    if isinstance(image, bytes):
+        logger.info(f"Processing in-memory image ({len(image)} bytes)")
+        return image
+    logger.info(f"Processing image: {image}")
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+def _image_part(image_content: bytes) -> Dict:
+    return {
+        'mime_type': image_mime_type(image_content),
+        'data': base64.b64encode(image_content).decode('utf-8')
+    }
+
+async def _extract_structured(
+    page_part: Union[str, Dict],
+    label: str,
+    estimated_tokens: int = ESTIMATED_TOKENS_PER_PAGE,
+    kind: str = "page"
+) -> Optional[InvoiceExtraction]:
+    """Run the structured extraction prompt on one page (image or text part)."""
+    response = await _generate_content(
+        [page_part, _spec().prompt], _structured_config(), estimated_tokens, kind
+    )
+    extraction, fields, failed = parse_extraction(response.text)
+
+    # Re-ask only for the fields that failed validation, not the whole page
+    for _ in range(EXTRACTION_REASK_ATTEMPTS):
+        if extraction is not None:
+            break
+        logger.info(f"Re-asking page {label} for fields: {', '.join(failed)}")
+        response = await _generate_content(
+            [page_part, _spec().reask_prompt(failed)], _structured_config(failed), estimated_tokens, "reask"
+        )
+        extraction, fields, failed = parse_extraction(response.text, fields)
+
+    if extraction is None:
+        logger.error(f"Extraction failed validation for fields: {', '.join(failed)}")
+    return extraction
+
+async def extract_invoice_data(image: Union[str, bytes]) -> Optional[Dict]:
+    """Extract invoice data from an image path or encoded image bytes using Gemini API."""
+    try:
+        image_content = _read_image(image)
+
+        cache = get_extraction_cache()
+        cache_key = make_cache_key(image_content, PROMPT_VERSION)
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Extraction cache hit for page {cache_key[:12]}")
+            return cached
+
+        extraction = await _extract_structured(_image_part(image_content), cache_key[:12])
+        if extraction is None:
+            return None
+
+        mapped_data = to_invoice_data(extraction)
+        await cache.set(cache_key, mapped_data)
+        return mapped_data
+        
+    except Exception as e:
+        logger.error(f"Error extracting invoice data: {str(e)}")
+        return None
+
+# Called with (page_number, extracted data or None) as each page finishes
+PageCallback = Callable[[int, Optional[Dict]], Awaitable[None]]
+
+async def extract_text_invoice_data(page: TextPage) -> Optional[Dict]:
+    """
+    Extract invoice data from a digital page's text layer: with the supplier's
+    template when one matches, otherwise with a text-only prompt.
+    """
+    try:
+        template = find_template(page)
+        if template is not None:
+            try:
+                extraction = invoice_adapter.validate_python(template.parse(page))
+                logger.info(f"Parsed page {page.page_number} with template for {template.gstin}")
+                return to_invoice_data(extraction)
+            except ValidationError as e:
+                logger.warning(f"Template for {template.gstin} did not fit page {page.page_number}: {str(e)}")
+
+        page_text = page.as_prompt_text()
+        cache = get_extraction_cache()
+        cache_key = make_cache_key(page_text.encode("utf-8"), f"{PROMPT_VERSION}:text")
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Extraction cache hit for text page {cache_key[:12]}")
+            return cached
+
+        # About four characters per token, plus the structured answer
+        estimated_tokens = len(page_text) // 4 + 1000
+        extraction = await _extract_structured(
+            f"Text of the invoice page:\n{page_text}", cache_key[:12], estimated_tokens, "text"
+        )
+        if extraction is None:
+            return None
+
+        mapped_data = to_invoice_data(extraction)
+        await cache.set(cache_key, mapped_data)
+        return mapped_data
+
+    except Exception as e:
+        logger.error(f"Error extracting invoice data from text: {str(e)}")
+        return None
+
+async def _extract_text_pages(
+    pages: List[TextPage],
+    on_page: Optional[PageCallback] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> List[Dict]:
+    """Extract digital pages concurrently, without rendering them."""
+    semaphore = semaphore or asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+    async def extract_page(page: TextPage) -> Optional[Dict]:
+        async with semaphore:
+            result = await extract_text_invoice_data(page)
+        if result:
+            result['page_number'] = page.page_number
+        if on_page is not None:
+            await on_page(page.page_number, result)
+        return result
+
+    page_results = await asyncio.gather(*(extract_page(page) for page in pages))
+    return [result for result in page_results if result]
+
+async def _extract_batch(pages: List[Tuple[int, bytes]]) -> Dict[int, Optional[Dict]]:
+    """
+    Extract several pages with one request returning an array keyed by page
+    number. A failed request is split in half and retried; pages missing or
+    invalid in an otherwise good response are re-done one at a time.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    if len(pages) == 1:
+        page_number, image_content = pages[0]
+        return {page_number: await extract_invoice_data(image_content)}
+
+    contents: List = []
+    for page_number, image_content in pages:
+        contents.extend([f"Page {page_number}:", _image_part(image_content)])
+    contents.append(_spec().batch_prompt)
+
+    try:
+        response = await _generate_content(
+            contents, _structured_config(batch=True), ESTIMATED_TOKENS_PER_PAGE * len(pages), "batch"
+        )
+        batch_sizer.record(len(pages), getattr(response, "usage_metadata", None))
+        extractions = parse_batch_extraction(response.text)
+    except google_exceptions.ResourceExhausted:
+        logger.error(f"Quota exhausted extracting pages {pages[0][0]}-{pages[-1][0]}")
+        return {page_number: None for page_number, _ in pages}
+    except Exception as e:
+        logger.warning(f"Batch of {len(pages)} pages failed, splitting it: {str(e)}")
+        middle = len(pages) // 2
+        results = await _extract_batch(pages[:middle])
+        results.update(await _extract_batch(pages[middle:]))
+        return results
+
+    cache = get_extraction_cache()
+    results: Dict[int, Optional[Dict]] = {}
+    for page_number, image_content in pages:
+        extraction = extractions.get(page_number)
+        if extraction is None:
+            results[page_number] = await extract_invoice_data(image_content)
+            continue
+        results[page_number] = to_invoice_data(extraction)
+        await cache.set(make_cache_key(image_content, PROMPT_VERSION), results[page_number])
+    return results
+
+async def _extract_chunk(pages: List[Tuple[int, Union[str, bytes]]]) -> Dict[int, Optional[Dict]]:
+    """Serve cached pages directly and extract the rest in one batch."""
+    if len(pages) == 1:
+        page_number, image = pages[0]
+        return {page_number: await extract_invoice_data(image)}
+
+    cache = get_extraction_cache()
+    results: Dict[int, Optional[Dict]] = {}
+    misses: List[Tuple[int, bytes]] = []
+    for page_number, image in pages:
+        image_content = _read_image(image)
+        cached = await cache.get(make_cache_key(image_content, PROMPT_VERSION))
+        if cached is not None:
+            results[page_number] = cached
+        else:
+            misses.append((page_number, image_content))
+    if misses:
+        results.update(await _extract_batch(misses))
+    return results
+
+async def _as_async(pages: Iterable):
+    for page in pages:
+        yield page
+
+async def _take(pages: AsyncIterator, count: int) -> List:
+    """Pull up to `count` items from an async iterator."""
+    items = []
+    for _ in range(count):
+        try:
+            items.append(await pages.__anext__())
+        except StopAsyncIteration:
+            break
+    return items
+
+async def _extract_pages(
+    pages: Union[Iterable[Tuple[int, Union[str, bytes]]], AsyncIterable[Tuple[int, bytes]]],
+    on_page: Optional[PageCallback] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> List[Dict]:
+    """
+    Extract invoice data from (page_number, image) pairs concurrently.
+    Pages are taken in chunks sized by `batch_sizer`, one request per chunk.
+    The next chunk is only pulled from `pages` once a worker slot is free, so a
+    lazy page generator never renders more pages than are being extracted.
+    """
+    semaphore = semaphore or asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+    async def extract_chunk(chunk: List[Tuple[int, Union[str, bytes]]]) -> List[Optional[Dict]]:
+        try:
+            results = await _extract_chunk(chunk)
+        finally:
+            semaphore.release()
+        chunk_results = []
+        for page_number, _ in chunk:
+            result = results.get(page_number)
+            if result:
+                result['page_number'] = page_number
+            if on_page is not None:
+                await on_page(page_number, result)
+            chunk_results.append(result)
+        return chunk_results
+
+    tasks = []
+    page_iterator = pages.__aiter__() if hasattr(pages, "__aiter__") else _as_async(pages)
+    while True:
+        await semaphore.acquire()
+        chunk = await _take(page_iterator, batch_sizer.size())
+        if not chunk:
+            semaphore.release()
+            break
+        tasks.append(asyncio.create_task(extract_chunk(chunk)))
+
+    chunk_results = await asyncio.gather(*tasks)
+    return [result for results in chunk_results for result in results if result]
+
+def _write_csv(df: "pd.DataFrame", output_file: str) -> None:
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    df.to_csv(output_file, index=False)
+
+async def process_pdf_invoice(
+    pdf: Union[str, bytes],
+    output_folder: Optional[str] = None,
+    on_page: Optional[PageCallback] = None
+) -> Tuple["pd.DataFrame", Optional[str]]:
+    """
+    Process a PDF invoice and extract data from all pages.
+    Returns the results and the path of their CSV copy, if EXTRACTION_CSV_DIR is set.
+    `pdf` may be a file path (pages are rendered to `output_folder`) or the raw
+    PDF bytes, in which case digital pages are read from their text layer and
+    scanned pages are rendered and extracted in memory.
+    `on_page` is awaited after each page with its extraction result.
+    """
+    import pandas as pd
+
+    try:
+        if isinstance(pdf, bytes):
+            # Digital pages are read from their text layer; only scans are rendered
+            text_pages, scanned_pages = await asyncio.to_thread(classify_pages, pdf)
+            # Both kinds of page share one GEMINI_MAX_CONCURRENCY budget
+            semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+            text_results, image_results = await asyncio.gather(
+                _extract_text_pages(text_pages, on_page, semaphore),
+                _extract_pages(render_pdf_pages(pdf, page_numbers=scanned_pages), on_page, semaphore)
+            )
+            all_results = sorted(text_results + image_results, key=lambda result: result['page_number'])
+        else:
+            image_paths = await pdf_to_images(pdf, output_folder)
+            all_results = await _extract_pages(enumerate(image_paths, 1), on_page)
+            
+        # Create DataFrame
+        df = pd.DataFrame(all_results)
+        
+        output_file = None
+        if EXTRACTION_CSV_DIR:
+            # Unique per document, so concurrent uploads never overwrite each other
+            output_file = os.path.join(
+                EXTRACTION_CSV_DIR,
+                f"invoice_details_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.csv"
+            )
+            await asyncio.to_thread(_write_csv, df, output_file)
+
+        return df, output_file
+        
+    except Exception as e:
+        logger.error(f"Error processing PDF invoice: {str(e)}")
+        raise
+
+async def validate_extracted_data(data: Dict) -> bool:
+    """
+    Validate the extracted invoice data.
+    Returns True if data is valid, False otherwise.
+    """
+    required_fields = [
+        "invoice_number",
+        "issue_date",
+        "due_date",
+        "total_amount"
+    ]
+    
+    try:
+        # Check required fields
+        for field in required_fields:
+            if not data.get(field):
+                print(f"Missing required field: {field}")
+                return False
+        
+        # Validate amounts
+        if data["total_amount"] <= 0:
+            print("Invalid total amount")
+            return False
+            
+        if data["tax_amount"] < 0:
+            print("Invalid tax amount")
+            return False
+            
+        # Validate dates
+        if data["due_date"] < data["issue_date"]:
+            print("Due date cannot be earlier than issue date")
+            return False
+            
+        return True
+        
+    except Exception as e:
+        print(f"Error validating data: {str(e)}")
         return False 
\ No newline at end of file
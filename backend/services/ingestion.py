@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from database.supabase import Database
+from models.invoice import InvoiceStatus
+from services.gemini import process_pdf_invoice, PageCallback
+from services.parties import party_resolver
+from services.line_items import build_line_items
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def map_extracted_invoice(
+    result: Dict,
+    filename: str,
+    buyer_id: Optional[int],
+    supplier_id: Optional[int]
+) -> Dict:
+    """Map one page of extracted data to an `invoices` row."""
+    return {
+        'invoice_number': result['invoice_number'],
+        'buyer_id': buyer_id,
+        'supplier_id': supplier_id,
+        'amount': float(result['total_amount']) - float(result['tax_amount']),
+        'tax_amount': float(result['tax_amount']),
+        'total_amount': float(result['total_amount']),
+        'status': InvoiceStatus.DRAFT.value,
+        'due_date': datetime.strptime(result['issue_date'], "%Y-%m-%d").isoformat(),
+        'notes': f"Processed from PDF: {filename}, Page: {result.get('page_number', 1)}"
+    }
+
+
+async def ingest_pdf(
+    db: Database,
+    content: bytes,
+    filename: str,
+    on_page: Optional[PageCallback] = None
+) -> Dict:
+    """
+    Extract invoices from an uploaded PDF and store them.
+    Shared by the synchronous upload route and background ingestion jobs.
+    """
+    with span("ingestion.extract", filename=filename):
+        df, output_file = await process_pdf_invoice(content, on_page=on_page)
+
+    # Convert results to list of dictionaries
+    results = df.to_dict(orient='records')
+
+    # Resolve every buyer and supplier in the document together
+    with span("ingestion.resolve_parties", pages=len(results)):
+        party_ids = await party_resolver.resolve(db, results)
+
+    # Map every page first, then store the whole document in chunked bulk upserts
+    rows: List[Dict] = []
+    row_pages: List[int] = []
+    row_results: List[Dict] = []
+    errors: List[Dict] = []
+    seen_numbers = set()
+    for result, (buyer_id, supplier_id) in zip(results, party_ids):
+        page_number = result.get('page_number')
+        try:
+            row = map_extracted_invoice(result, filename, buyer_id, supplier_id)
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append({
+                "page_number": page_number,
+                "invoice_number": result.get('invoice_number'),
+                "error": f"Could not map extracted data: {str(e)}"
+            })
+            continue
+        # An upsert batch may not touch the same invoice_number twice
+        if row['invoice_number'] in seen_numbers:
+            errors.append({
+                "page_number": page_number,
+                "invoice_number": row['invoice_number'],
+                "error": "Duplicate invoice number within document"
+            })
+            continue
+        seen_numbers.add(row['invoice_number'])
+        rows.append(row)
+        row_pages.append(page_number)
+        row_results.append(result)
+
+    with span("ingestion.store_invoices", rows=len(rows)):
+        created_invoices, existing_invoices, insert_errors = await db.upsert_invoices(rows)
+    # Invoices already on file are reported, not overwritten
+    for entry in existing_invoices + insert_errors:
+        entry["page_number"] = row_pages[entry.pop("index")]
+    errors.extend(insert_errors)
+
+    # Store the line items of every stored invoice in one bulk insert
+    invoice_ids = {invoice['invoice_number']: invoice['id'] for invoice in created_invoices}
+    line_items: List[Dict] = []
+    linked_ids: List[int] = []
+    for row, result in zip(rows, row_results):
+        invoice_id = invoice_ids.get(str(row['invoice_number']))
+        if invoice_id is not None:
+            linked_ids.append(invoice_id)
+            line_items.extend(build_line_items(result, invoice_id))
+    if linked_ids:
+        try:
+            with span("ingestion.store_line_items", items=len(line_items)):
+                await db.replace_invoice_items(linked_ids, line_items)
+        except Exception as e:
+            errors.append({"error": f"Could not store line items: {str(e)}"})
+
+    logger.info(f"Ingested {len(created_invoices)} invoices from {filename} ({len(errors)} errors)")
+    return {
+        "success": not errors,
+        "message": f"Successfully processed {len(created_invoices)} invoices",
+        "invoices": created_invoices,
+        "existing_invoices": existing_invoices,
+        "errors": errors,
+        "output_file": output_file
+    }
@@ -0,0 +1,157 @@
+import os
+import enum
+import time
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from database.supabase import Database
+from services.gemini import count_pdf_pages
+from services.ingestion import ingest_pdf
+from app.tracing import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", 100))
+# How long finished jobs stay queryable before they are pruned
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 3600))
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestionJob:
+    """State of one background PDF ingestion."""
+
+    def __init__(self, filename: str, content: bytes):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.content: Optional[bytes] = content
+        self.status = JobStatus.QUEUED
+        self.total_pages: Optional[int] = None
+        self.pages_done = 0
+        self.partial_results: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    async def update(self, **changes) -> None:
+        """Apply changes and wake up any progress subscribers."""
+        async with self._changed:
+            for key, value in changes.items():
+                setattr(self, key, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    async def wait_for_change(self, version: int) -> None:
+        """Wait until the job has moved past `version`."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.version != version)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status.value,
+            "total_pages": self.total_pages,
+            "pages_done": self.pages_done,
+            "partial_results": self.partial_results,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """In-process queue and worker pool for PDF ingestion on single-node deployments."""
+
+    def __init__(self, workers: int = INGESTION_WORKERS, queue_size: int = INGESTION_QUEUE_SIZE):
+        self.workers = workers
+        self._queue: "asyncio.Queue[IngestionJob]" = asyncio.Queue(maxsize=queue_size)
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the worker tasks; called on application startup."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} ingestion workers")
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks; called on application shutdown."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, content: bytes, filename: str) -> IngestionJob:
+        """Queue a PDF for ingestion and return its job immediately; raises asyncio.QueueFull."""
+        self._prune()
+        job = IngestionJob(filename, content)
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict]:
+        """Yield job snapshots on every change until the job finishes."""
+        job = self._jobs[job_id]
+        while True:
+            version = job.version
+            yield job.to_dict()
+            if job.finished:
+                return
+            await job.wait_for_change(version)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob) -> None:
+        async def on_page(page_number: int, result: Optional[Dict]) -> None:
+            job.pages_done += 1
+            if result:
+                job.partial_results.append(result)
+            await job.update()
+
+        try:
+            await job.update(
+                status=JobStatus.RUNNING,
+                total_pages=count_pdf_pages(job.content)
+            )
+            with span("ingestion.job", job_id=job.id, filename=job.filename):
+                result = await ingest_pdf(Database(), job.content, job.filename, on_page=on_page)
+            await job.update(status=JobStatus.COMPLETED, result=result, finished_at=time.time())
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            await job.update(status=JobStatus.FAILED, error=str(e), finished_at=time.time())
+        finally:
+            job.content = None  # the PDF is no longer needed once processed
+
+
+job_manager = JobManager()
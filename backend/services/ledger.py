@@ -0,0 +1,40 @@
+import os
+import asyncio
+import logging
+from celery.schedules import crontab
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from database.supabase import Database
+from services.alerts import celery_app
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Entries older than this are folded into a snapshot by the compaction task
+LEDGER_COMPACT_AFTER_DAYS = int(os.getenv("LEDGER_COMPACT_AFTER_DAYS", 365))
+LEDGER_PRUNE_COMPACTED = os.getenv("LEDGER_PRUNE_COMPACTED", "false").lower() == "true"
+
+
+async def compact_ledger(before: date, prune: bool = LEDGER_PRUNE_COMPACTED) -> int:
+    """Snapshot every party's balance as of `before`; returns the number of snapshots written."""
+    snapshots = await Database().compact_ledger(before.isoformat(), prune)
+    logger.info(f"Ledger compacted before {before}: {snapshots} party snapshots (prune={prune})")
+    return snapshots
+
+
+@celery_app.task
+def compact_ledger_task():
+    """Celery task for periodic ledger compaction."""
+    try:
+        before = date.today().replace(day=1) - timedelta(days=LEDGER_COMPACT_AFTER_DAYS)
+        return {"snapshots": asyncio.run(compact_ledger(before))}
+    except Exception as e:
+        logger.error(f"Error compacting ledger: {str(e)}")
+        return {"error": str(e)}
+
+
+celery_app.conf.beat_schedule["compact-ledger"] = {
+    "task": compact_ledger_task.name,
+    "schedule": crontab(hour=2, minute=0, day_of_month=1),
+}
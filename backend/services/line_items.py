@@ -0,0 +1,43 @@
+from typing import Dict, List, Optional, Tuple
+from services.numbers import split_amounts
+
+
+def _split_item_lists(result: Dict) -> Tuple[List[str], List[Optional[float]], List[Optional[float]]]:
+    """Recover parallel item lists from the older comma-split extraction format."""
+    descriptions = [
+        str(item).strip() for item in result.get('items') or []
+        if str(item).strip() and str(item).strip().upper() != "NAN"
+    ]
+    quantities = split_amounts(result.get('quantities') or [], len(descriptions))
+    rates = split_amounts(result.get('rates') or [], len(descriptions))
+    return descriptions, quantities, rates
+
+
+def build_line_items(result: Dict, invoice_id: int) -> List[Dict]:
+    """
+    Turn the items/quantities/rates of one extracted invoice into typed
+    `invoice_items` rows. Items without a readable rate are skipped and
+    a missing quantity counts as 1.
+    """
+    line_items = result.get('line_items')
+    if isinstance(line_items, list):
+        # Structured extraction already returns typed items
+        descriptions = [item.get('description') for item in line_items]
+        quantities = [item.get('quantity') for item in line_items]
+        rates = [item.get('rate') for item in line_items]
+    else:
+        descriptions, quantities, rates = _split_item_lists(result)
+
+    rows = []
+    for description, quantity, rate in zip(descriptions, quantities, rates):
+        if rate is None:
+            continue
+        quantity = quantity if quantity is not None else 1.0
+        rows.append({
+            'invoice_id': invoice_id,
+            'description': description,
+            'quantity': quantity,
+            'unit_price': rate,
+            'total_price': round(quantity * rate, 2),
+        })
+    return rows
@@ -0,0 +1,198 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+from dotenv import load_dotenv
+from services.rate_limiter import AsyncRateLimiter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "email")
+
+
+class EmailConfig:
+    SMTP_HOST = os.getenv("SMTP_HOST")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+    SMTP_USER = os.getenv("SMTP_USER")
+    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+    SMTP_START_TLS = os.getenv("SMTP_START_TLS", "true").lower() == "true"
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+    EMAIL_FROM = os.getenv("EMAIL_FROM")
+    # Persistent connections kept open to the relay; also the send concurrency
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+    # Messages per minute through the relay, and to any single recipient domain
+    SMTP_MESSAGES_PER_MINUTE = float(os.getenv("SMTP_MESSAGES_PER_MINUTE", 300))
+    SMTP_DOMAIN_MESSAGES_PER_MINUTE = float(os.getenv("SMTP_DOMAIN_MESSAGES_PER_MINUTE", 60))
+    SMTP_MAX_RETRIES = int(os.getenv("SMTP_MAX_RETRIES", 3))
+
+
+@lru_cache()
+def _template_environment() -> Environment:
+    return Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+
+
+@lru_cache()
+def get_template(name: str) -> Template:
+    """Compile an email template once per process and reuse it for every message."""
+    return _template_environment().get_template(name)
+
+
+class OutgoingEmail:
+    """
+    One message to deliver. `key` identifies it across retries and runs: it is
+    used as the Message-ID and to skip messages that were already sent.
+    """
+
+    def __init__(self, key: str, to: str, subject: str, html: str):
+        self.key = key
+        self.to = to
+        self.subject = subject
+        self.html = html
+
+    @property
+    def domain(self) -> str:
+        return self.to.rsplit("@", 1)[-1].lower()
+
+    def to_message(self, mail_from: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = mail_from
+        message["To"] = self.to
+        message["Subject"] = self.subject
+        sender_domain = mail_from.rsplit("@", 1)[-1].strip("> ")
+        message["Message-ID"] = f"<{self.key}@{sender_domain}>"
+        message.set_content(self.html, subtype="html")
+        return message
+
+
+class SMTPConnectionPool:
+    """A fixed number of persistent SMTP sessions, opened lazily and reused across messages."""
+
+    def __init__(self, config=EmailConfig, size: Optional[int] = None):
+        self.config = config
+        self._slots = asyncio.Semaphore(size or config.SMTP_POOL_SIZE)
+        self._idle: List[aiosmtplib.SMTP] = []
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.config.SMTP_HOST,
+            port=self.config.SMTP_PORT,
+            start_tls=self.config.SMTP_START_TLS,
+            timeout=self.config.SMTP_TIMEOUT
+        )
+        await client.connect()
+        if self.config.SMTP_USER:
+            await client.login(self.config.SMTP_USER, self.config.SMTP_PASSWORD)
+        return client
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[aiosmtplib.SMTP]:
+        async with self._slots:
+            client = self._idle.pop() if self._idle else None
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            try:
+                yield client
+            finally:
+                # Sessions dropped by the server are discarded and reopened on demand
+                if client.is_connected:
+                    self._idle.append(client)
+
+    async def close(self) -> None:
+        while self._idle:
+            client = self._idle.pop()
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+
+class MailDelivery:
+    """
+    Sends messages over a pooled set of SMTP connections with bounded
+    concurrency, rate limits per relay and per recipient domain, and retries
+    for transient failures. A message is never sent twice in one delivery.
+    """
+
+    def __init__(self, config=EmailConfig):
+        self.config = config
+        self.pool = SMTPConnectionPool(config)
+        self._relay_limiter = AsyncRateLimiter(config.SMTP_MESSAGES_PER_MINUTE)
+        self._domain_limiters: Dict[str, AsyncRateLimiter] = {}
+
+    def _domain_limiter(self, domain: str) -> AsyncRateLimiter:
+        if domain not in self._domain_limiters:
+            self._domain_limiters[domain] = AsyncRateLimiter(self.config.SMTP_DOMAIN_MESSAGES_PER_MINUTE)
+        return self._domain_limiters[domain]
+
+    async def _send(self, email: OutgoingEmail) -> bool:
+        message = email.to_message(self.config.EMAIL_FROM)
+        domain_limiter = self._domain_limiter(email.domain)
+        for attempt in range(self.config.SMTP_MAX_RETRIES + 1):
+            await self._relay_limiter.acquire()
+            await domain_limiter.acquire()
+            try:
+                async with self.pool.connection() as client:
+                    await client.send_message(message)
+                domain_limiter.reset_backoff()
+                return True
+            except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused) as e:
+                logger.error(f"Message {email.key} to {email.to} refused: {str(e)}")
+                return False
+            except aiosmtplib.SMTPResponseException as e:
+                if not 400 <= e.code < 500:
+                    logger.error(f"Message {email.key} to {email.to} rejected: {str(e)}")
+                    return False
+                # 4xx is the server asking us to slow down or come back later
+                domain_limiter.backoff()
+            except (aiosmtplib.SMTPException, OSError) as e:
+                logger.warning(f"Sending {email.key} failed (attempt {attempt + 1}): {str(e)}")
+                domain_limiter.backoff()
+        logger.error(f"Giving up on message {email.key} to {email.to}")
+        return False
+
+    async def send_all(
+        self,
+        emails: List[OutgoingEmail],
+        already_sent: Optional[Set[str]] = None,
+        on_sent: Optional[Callable[[OutgoingEmail], Awaitable[None]]] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Deliver `emails`, skipping keys in `already_sent`.
+        `on_sent` is awaited as soon as each message is accepted by the relay,
+        so callers can record it before the rest of the batch finishes.
+        Returns the keys that were sent, failed and skipped.
+        """
+        sent = set(already_sent or ())
+        outcome: Dict[str, List[str]] = {"sent": [], "failed": [], "skipped": []}
+        pending = []
+        for email in emails:
+            if email.key in sent:
+                outcome["skipped"].append(email.key)
+                continue
+            sent.add(email.key)
+            pending.append(email)
+
+        async def deliver(email: OutgoingEmail) -> bool:
+            delivered = await self._send(email)
+            if delivered and on_sent is not None:
+                await on_sent(email)
+            return delivered
+
+        # Let every delivery finish before surfacing an error from one of them
+        results = await asyncio.gather(*(deliver(email) for email in pending), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        for email, delivered in zip(pending, results):
+            outcome["sent" if delivered else "failed"].append(email.key)
+        return outcome
+
+    async def close(self) -> None:
+        await self.pool.close()
@@ -0,0 +1,51 @@
+import re
+import math
+from typing import List, Optional
+
+# A single amount written with Indian (1,23,456.50) or Western (123,456.50) digit
+# grouping, or with no grouping at all
+GROUPED_NUMBER_PATTERN = re.compile(
+    r"\d{1,3}(?:,\d{2})+,\d{3}(?:\.\d+)?"
+    r"|\d{1,3}(?:,\d{3})+(?:\.\d+)?"
+    r"|\d+(?:\.\d+)?"
+)
+# Currency markers written around amounts: ₹, Rs, Rs., INR
+CURRENCY_PATTERN = re.compile(r"₹|\b(?:rs|inr)\b\.?", re.I)
+
+
+def parse_amount(value) -> Optional[float]:
+    """
+    Parse amounts such as '1,23,456.50', 'Rs. 500', '1,000/-' or '(200.00)'.
+    Returns None unless the whole value is one (optionally signed) amount.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    text = CURRENCY_PATTERN.sub("", str(value)).strip()
+    if text.endswith("/-"):
+        text = text[:-2].strip()
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1].strip()
+    if text.startswith("-"):
+        negative = True
+        text = text[1:].strip()
+    if not GROUPED_NUMBER_PATTERN.fullmatch(text):
+        return None
+    amount = float(text.replace(",", ""))
+    return -amount if negative else amount
+
+
+def split_amounts(values: List[str], expected: int) -> List[Optional[float]]:
+    """
+    Recover per-item numbers from a comma-split list.
+    The extractor joins item values with commas, which also split grouped
+    numbers such as '1,200'. The parts are re-joined and read as grouped
+    numbers first; if that does not yield one value per item, each part is
+    taken as its own value. The result is padded or cut to `expected` entries.
+    """
+    parts = [str(value).strip() for value in values if str(value).strip()]
+    grouped = [parse_amount(token) for token in GROUPED_NUMBER_PATTERN.findall(",".join(parts))]
+    amounts = grouped if len(grouped) == expected else [parse_amount(part) for part in parts]
+    return (amounts + [None] * expected)[:expected]
@@ -0,0 +1,51 @@
+import logging
+from datetime import date
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Same bucket boundaries as the aging_report() SQL function
+AGING_BUCKETS = ["not_due", "days_0_30", "days_31_60", "days_61_90", "days_over_90"]
+PARTY_COLUMNS = {"buyer": "buyer_id", "supplier": "supplier_id"}
+
+
+def compute_aging(balances: List[Dict], group_by: str, as_of: date) -> List[Dict]:
+    """
+    Bucket open balances by days past due and total them per party.
+    Vectorised fallback for ad-hoc slices that the SQL rollup does not cover;
+    `balances` are invoice_balances rows.
+    """
+    # Imported here so API workers only load pandas when a slice is requested
+    import numpy as np
+    import pandas as pd
+
+    party_column = PARTY_COLUMNS[group_by]
+    if not balances:
+        return []
+
+    df = pd.DataFrame.from_records(balances, columns=[party_column, "due_date", "outstanding"])
+    outstanding = pd.to_numeric(df["outstanding"])
+    due = pd.to_datetime(df["due_date"], utc=True).dt.tz_convert(None).dt.normalize()
+    days_overdue = (pd.Timestamp(as_of) - due).dt.days.to_numpy()
+
+    bucket = np.select(
+        [days_overdue <= 0, days_overdue <= 30, days_overdue <= 60, days_overdue <= 90],
+        AGING_BUCKETS[:4],
+        default=AGING_BUCKETS[4]
+    )
+    party = df[party_column].astype("Int64")
+
+    report = pd.crosstab(party, bucket, values=outstanding, aggfunc="sum", dropna=False)
+    report = report.reindex(columns=AGING_BUCKETS, fill_value=0).fillna(0)
+    report["total_outstanding"] = report[AGING_BUCKETS].sum(axis=1)
+    report["invoice_count"] = party.value_counts(dropna=False)
+    report = report.sort_values("total_outstanding", ascending=False)
+
+    rows = []
+    for party_id, values in report.iterrows():
+        row = {"party_id": None if pd.isna(party_id) else int(party_id)}
+        row.update({bucket_name: round(float(values[bucket_name]), 2) for bucket_name in AGING_BUCKETS})
+        row["total_outstanding"] = round(float(values["total_outstanding"]), 2)
+        row["invoice_count"] = int(values["invoice_count"])
+        rows.append(row)
+    return rows
@@ -0,0 +1,123 @@
+import re
+import time
+import asyncio
+import difflib
+import logging
+from typing import Dict, List, Optional, Tuple
+from database.supabase import Database
+
+logger = logging.getLogger(__name__)
+
+GSTIN_PATTERN = re.compile(r"\b\d{2}[A-Z]{5}\d{4}[A-Z][A-Z\d]Z[A-Z\d]\b")
+# Minimum similarity for the fuzzy name fallback used when no GSTIN was extracted
+NAME_MATCH_CUTOFF = 0.9
+# Re-read the tables after this long so parties created by other workers are seen
+INDEX_REFRESH_SECONDS = 600
+
+
+def normalise_gstin(value: Optional[str]) -> Optional[str]:
+    """Return the canonical 15-character GSTIN, or None if `value` is not a valid one."""
+    if not value:
+        return None
+    candidate = re.sub(r"[^A-Za-z0-9]", "", str(value)).upper()
+    return candidate if GSTIN_PATTERN.fullmatch(candidate) else None
+
+
+def normalise_name(value: Optional[str]) -> str:
+    """Case, punctuation and common suffix-insensitive key for party names."""
+    name = re.sub(r"[^a-z0-9 ]", " ", str(value or "").lower())
+    name = re.sub(r"\b(m s|messrs|pvt|private|ltd|limited|co|the)\b", " ", name)
+    name = " ".join(name.split())
+    return "" if name == "nan" else name
+
+
+class PartyIndex:
+    """In-process index of one party table (buyers or suppliers) by GSTIN and name."""
+
+    def __init__(self, table: str):
+        self.table = table
+        self.by_gstin: Dict[str, int] = {}
+        self.by_name: Dict[str, int] = {}
+        self.warmed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def add(self, party: Dict) -> None:
+        gstin = normalise_gstin(party.get('gst_no'))
+        if gstin:
+            self.by_gstin[gstin] = party['id']
+        name = normalise_name(party.get('name'))
+        if name:
+            self.by_name.setdefault(name, party['id'])
+
+    async def warm(self, db: Database) -> None:
+        """Load the whole table once, then again every INDEX_REFRESH_SECONDS."""
+        async with self._lock:
+            if time.monotonic() - self.warmed_at < INDEX_REFRESH_SECONDS:
+                return
+            for party in await db.get_parties(self.table):
+                self.add(party)
+            self.warmed_at = time.monotonic()
+            logger.info(f"Warmed {self.table} index with {len(self.by_gstin)} GSTINs")
+
+    def lookup(self, gstin: Optional[str], name: str) -> Optional[int]:
+        if gstin:
+            return self.by_gstin.get(gstin)
+        if not name:
+            return None
+        if name in self.by_name:
+            return self.by_name[name]
+        close = difflib.get_close_matches(name, self.by_name.keys(), n=1, cutoff=NAME_MATCH_CUTOFF)
+        return self.by_name[close[0]] if close else None
+
+    async def resolve(self, db: Database, details: List[Dict]) -> List[Optional[int]]:
+        """
+        Resolve extracted party details to ids, creating unknown parties with at
+        most one bulk insert-or-fetch by GSTIN and one by normalised name (for
+        parties without a GSTIN). Parties that already exist are never
+        overwritten with extracted text.
+        """
+        await self.warm(db)
+        keys = [(normalise_gstin(d.get('gst_no')), normalise_name(d.get('name'))) for d in details]
+
+        new_with_gstin: Dict[str, Dict] = {}
+        new_without_gstin: Dict[str, Dict] = {}
+        for (gstin, name), detail in zip(keys, details):
+            if self.lookup(gstin, name) is not None:
+                continue
+            # Every row carries the same keys: PostgREST rejects bulk writes with mixed key sets
+            city = detail.get('city')
+            row = {
+                'name': str(detail.get('name') or gstin or 'Unknown').strip(),
+                'gst_no': gstin,
+                'city': city if city and normalise_name(city) else None,
+            }
+            if gstin:
+                new_with_gstin.setdefault(gstin, row)
+            elif name:
+                new_without_gstin.setdefault(name, dict(row, name_key=name))
+
+        if new_with_gstin:
+            for party in await db.upsert_parties(self.table, list(new_with_gstin.values())):
+                self.add(party)
+        if new_without_gstin:
+            for party in await db.upsert_parties(self.table, list(new_without_gstin.values()), key='name_key'):
+                self.add(party)
+
+        return [self.lookup(gstin, name) for gstin, name in keys]
+
+
+class PartyResolver:
+    """Resolves buyers and suppliers for a whole batch of extracted invoices."""
+
+    def __init__(self):
+        self.buyers = PartyIndex('buyers')
+        self.suppliers = PartyIndex('suppliers')
+
+    async def resolve(self, db: Database, results: List[Dict]) -> List[Tuple[Optional[int], Optional[int]]]:
+        """Return (buyer_id, supplier_id) for each extracted invoice, in order."""
+        buyer_ids = await self.buyers.resolve(db, [r.get('buyer_details') or {} for r in results])
+        supplier_ids = await self.suppliers.resolve(db, [r.get('supplier_details') or {} for r in results])
+        return list(zip(buyer_ids, supplier_ids))
+
+
+party_resolver = PartyResolver()
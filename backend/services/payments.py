@@ -0,0 +1,12 @@
+from typing import Dict, List
+from models.payment import PaymentStatus
+
+
+def summarize_payments(payments: List[Dict]) -> Dict:
+    """Paid amount and payment count for one invoice, counting completed payments only."""
+    completed = [p for p in payments if p.get('status') == PaymentStatus.COMPLETED.value]
+    return {
+        "paid_amount": round(sum(float(p['amount']) for p in completed), 2),
+        "payment_count": len(completed),
+        "last_payment_date": max((p['payment_date'] for p in completed if p.get('payment_date')), default=None),
+    }
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _TokenBucket:
+    """A single refilling bucket; capacity is replenished evenly over one minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class AsyncRateLimiter:
+    """
+    Async token-bucket limiter enforcing requests/minute and tokens/minute quotas.
+
+    Callers `await acquire(tokens)` before each model call and report 429s via
+    `backoff()`, which pauses every caller with exponential delay until a call
+    succeeds again (`reset_backoff()`).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        max_backoff: float = 60.0,
+    ):
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+        self._blocked_until = 0.0
+        self._backoff_attempts = 0
+        self.max_backoff = max_backoff
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until one request and `tokens` tokens fit within the quotas."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._requests.refill(now)
+                wait = max(self._blocked_until - now, self._requests.wait_time(1))
+                if self._tokens is not None:
+                    self._tokens.refill(now)
+                    wait = max(wait, self._tokens.wait_time(tokens))
+
+                if wait <= 0:
+                    self._requests.tokens -= 1
+                    if self._tokens is not None:
+                        self._tokens.tokens -= min(tokens, self._tokens.capacity)
+                    return
+
+                await asyncio.sleep(wait)
+
+    def record_usage(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the real token count of a call is known."""
+        if self._tokens is not None and actual:
+            self._tokens.tokens -= actual - estimated
+
+    def backoff(self) -> float:
+        """Register a rate-limit response and block all callers; returns the delay used."""
+        delay = min(self.max_backoff, 2 ** self._backoff_attempts)
+        self._backoff_attempts += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning(f"Rate limited by upstream, backing off for {delay:.1f}s")
+        return delay
+
+    def reset_backoff(self) -> None:
+        """Clear the backoff state after a successful call."""
+        self._backoff_attempts = 0
@@ -0,0 +1,311 @@
+import io
+import os
+import hashlib
+import re
+import csv
+import logging
+from datetime import date, datetime
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from database.supabase import Database
+from models.invoice import InvoiceStatus
+from models.payment import PaymentMethod, PaymentStatus
+from services.parties import GSTIN_PATTERN
+from services.numbers import parse_amount
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[A-Z0-9][A-Z0-9/\-]*")
+OFX_TRANSACTION_PATTERN = re.compile(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|$)", re.S | re.I)
+OFX_FIELD_PATTERN = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+# Accepted CSV header spellings for each statement field
+CSV_COLUMNS = {
+    "date": ("date", "txn date", "transaction date", "value date", "posting date"),
+    "amount": ("amount", "credit", "deposit", "credit amount", "amount (inr)"),
+    "reference": ("reference", "ref no", "ref no.", "cheque/ref no", "utr", "transaction id", "txn id"),
+    "description": ("description", "narration", "remarks", "particulars", "details"),
+}
+PAID_TOLERANCE = 0.005
+# Narration tokens shorter than this, or made of digits only, are too easily
+# incidental (amount or account fragments, UTR pieces) to name an invoice alone
+MIN_INVOICE_TOKEN_LENGTH = 6
+# Largest gap (in rupees) between line amount and outstanding balance that still counts as agreement
+AMOUNT_TOLERANCE = 1.0
+# Whether ambiguous CSV dates such as 03/04/2024 read as day/month (Indian banks) or month/day
+STATEMENT_DAY_FIRST = os.getenv("STATEMENT_DAY_FIRST", "true").lower() == "true"
+DAY_FIRST_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y")
+MONTH_FIRST_FORMATS = ("%m/%d/%Y", "%m-%d-%Y", "%m.%d.%Y", "%m/%d/%y", "%m-%d-%y", "%m.%d.%y")
+NAMED_MONTH_FORMATS = ("%d %b %Y", "%d-%b-%Y", "%d %b %y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y")
+
+
+def _cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _normalise(text: Optional[str]) -> str:
+    return re.sub(r"\s+", "", str(text or "")).upper()
+
+
+def statement_transaction_id(line: Dict) -> str:
+    """
+    The bank reference when there is one, else a digest of the line's content,
+    so re-uploads dedupe while lines of different statements never collide.
+    Always fits payments.transaction_id (VARCHAR(100)).
+    """
+    reference = line["reference"]
+    if reference and len(reference) <= 100:
+        return reference
+    key = reference or f"{line['date']}|{line['amount']:.2f}|{line['description']}|{line['line_number']}"
+    return "stmt:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def parse_statement_date(value: Optional[str], day_first: bool = STATEMENT_DAY_FIRST) -> Optional[str]:
+    """
+    Parse a statement date into ISO format; returns None for an empty value.
+    Raises ValueError when the value is not a recognisable date.
+    """
+    text = (value or "").strip()
+    if not text:
+        return None
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        pass
+    numeric = DAY_FIRST_FORMATS if day_first else MONTH_FIRST_FORMATS
+    for fmt in numeric + NAMED_MONTH_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{text}'")
+
+
+def parse_csv_statement(content: bytes, day_first: bool = STATEMENT_DAY_FIRST) -> List[Dict]:
+    """
+    Parse a bank/UPI CSV export into credit lines. A line whose date cannot be
+    read keeps the raw value and carries an `error` instead of being dropped.
+    """
+
+    reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig", errors="replace")))
+    headers = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+    columns = {
+        field: next((headers[alias] for alias in aliases if alias in headers), None)
+        for field, aliases in CSV_COLUMNS.items()
+    }
+    if columns["amount"] is None:
+        raise ValueError("Statement has no amount/credit column")
+
+    lines = []
+    for line_number, row in enumerate(reader, start=2):
+        amount = parse_amount(row.get(columns["amount"]))
+        if not amount or amount <= 0:
+            continue
+        line = {
+            "line_number": line_number,
+            "date": None,
+            "amount": amount,
+            "reference": (row.get(columns["reference"]) or "").strip() if columns["reference"] else "",
+            "description": (row.get(columns["description"]) or "").strip() if columns["description"] else "",
+        }
+        raw_date = row.get(columns["date"]) if columns["date"] else None
+        try:
+            line["date"] = parse_statement_date(raw_date, day_first)
+        except ValueError as e:
+            line["date"] = raw_date
+            line["error"] = str(e)
+        lines.append(line)
+    return lines
+
+
+def parse_ofx_statement(content: bytes) -> List[Dict]:
+    """Parse the credit transactions of an OFX/QFX statement (SGML or XML flavour)."""
+    text = content.decode("utf-8", errors="replace")
+    lines = []
+    for line_number, match in enumerate(OFX_TRANSACTION_PATTERN.finditer(text), start=1):
+        fields = {name.upper(): value.strip() for name, value in OFX_FIELD_PATTERN.findall(match.group(1))}
+        amount = parse_amount(fields.get("TRNAMT"))
+        if not amount or amount <= 0:
+            continue
+        posted = fields.get("DTPOSTED", "")[:8]
+        lines.append({
+            "line_number": line_number,
+            "date": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) == 8 else None,
+            "amount": amount,
+            "reference": fields.get("FITID", ""),
+            "description": " ".join(filter(None, [fields.get("NAME"), fields.get("MEMO")])),
+        })
+    return lines
+
+
+def parse_statement(content: bytes, filename: str, day_first: bool = STATEMENT_DAY_FIRST) -> List[Dict]:
+    """Parse a statement file, choosing the format from its extension."""
+    if filename.lower().endswith((".ofx", ".qfx")):
+        return parse_ofx_statement(content)
+    return parse_csv_statement(content, day_first)
+
+
+class InvoiceIndex:
+    """Hash indexes over open invoices for O(1) statement-line matching."""
+
+    def __init__(self, invoices: List[Dict]):
+        self.outstanding: Dict[int, float] = {}
+        self.invoices: Dict[int, Dict] = {}
+        self.by_number: Dict[str, Dict] = {}
+        self.by_gst_amount: Dict[Tuple[str, int], List[Dict]] = defaultdict(list)
+        self.by_amount: Dict[int, List[Dict]] = defaultdict(list)
+
+        for invoice in invoices:
+            balance = invoice.get("invoice_balances") or {}
+            if isinstance(balance, list):
+                balance = balance[0] if balance else {}
+            outstanding = float(balance.get("outstanding", invoice["total_amount"]))
+            if outstanding <= PAID_TOLERANCE:
+                continue
+            self.outstanding[invoice["id"]] = outstanding
+            self.invoices[invoice["id"]] = invoice
+            self.by_number[_normalise(invoice["invoice_number"])] = invoice
+            self._add_amount_keys(invoice, outstanding)
+
+    def _amount_buckets(self, invoice: Dict, outstanding: float) -> List[List[Dict]]:
+        cents = _cents(outstanding)
+        buckets = [self.by_amount[cents]]
+        gst_no = _normalise((invoice.get("buyers") or {}).get("gst_no"))
+        if gst_no:
+            buckets.append(self.by_gst_amount[(gst_no, cents)])
+        return buckets
+
+    def _add_amount_keys(self, invoice: Dict, outstanding: float) -> None:
+        for bucket in self._amount_buckets(invoice, outstanding):
+            bucket.append(invoice)
+
+    def _remove_amount_keys(self, invoice: Dict, outstanding: float) -> None:
+        for bucket in self._amount_buckets(invoice, outstanding):
+            bucket[:] = [candidate for candidate in bucket if candidate["id"] != invoice["id"]]
+
+    def _open(self, candidates: List[Dict]) -> List[Dict]:
+        return [invoice for invoice in candidates if self.outstanding.get(invoice["id"], 0) > PAID_TOLERANCE]
+
+    def _number_match_holds(self, token: str, invoice: Dict, amount: float) -> bool:
+        """A distinctive token names an invoice by itself; a weak one also needs the amount to agree."""
+        if len(token) >= MIN_INVOICE_TOKEN_LENGTH and not token.isdigit():
+            return True
+        return abs(self.outstanding[invoice["id"]] - amount) <= AMOUNT_TOLERANCE
+
+    def match(self, line: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """Find the invoice a statement line pays; returns (invoice, rule) or (None, None)."""
+        text = f"{line['reference']} {line['description']}".upper()
+
+        for token in TOKEN_PATTERN.findall(text):
+            invoice = self.by_number.get(token)
+            if invoice and self._open([invoice]) and self._number_match_holds(token, invoice, line["amount"]):
+                return invoice, "invoice_number"
+
+        cents = _cents(line["amount"])
+        for gst_no in GSTIN_PATTERN.findall(text):
+            candidates = self._open(self.by_gst_amount.get((gst_no, cents), []))
+            if candidates:
+                return candidates[0], "gst_amount"
+
+        candidates = self._open(self.by_amount.get(cents, []))
+        if len(candidates) == 1:
+            return candidates[0], "amount"
+        return None, None
+
+    def apply(self, invoice_id: int, amount: float) -> float:
+        """
+        Reduce an invoice's outstanding balance and re-key it under the new
+        balance, so later lines match what is actually still owed.
+        Returns the remaining balance.
+        """
+        invoice = self.invoices[invoice_id]
+        self._remove_amount_keys(invoice, self.outstanding[invoice_id])
+        self.outstanding[invoice_id] -= amount
+        if self.outstanding[invoice_id] > PAID_TOLERANCE:
+            self._add_amount_keys(invoice, self.outstanding[invoice_id])
+        return self.outstanding[invoice_id]
+
+
+async def reconcile_statement(
+    db: Database,
+    content: bytes,
+    filename: str,
+    payment_method: PaymentMethod = PaymentMethod.BANK_TRANSFER,
+    dry_run: bool = False,
+    day_first: bool = STATEMENT_DAY_FIRST
+) -> Dict:
+    """
+    Match statement lines to open invoices, then insert the payments and update
+    the invoice statuses in one transaction. With `dry_run` nothing is written.
+    """
+    lines = parse_statement(content, filename, day_first)
+    for line in lines:
+        line["transaction_id"] = statement_transaction_id(line)
+
+    # Lines already imported (same transaction id) must not be applied twice
+    seen = await db.get_existing_transaction_ids([line["transaction_id"] for line in lines])
+    index = InvoiceIndex(await db.get_open_invoices())
+
+    payments: List[Dict] = []
+    matched: List[Dict] = []
+    unmatched: List[Dict] = []
+    duplicates: List[Dict] = []
+    for line in lines:
+        if line["transaction_id"] in seen:
+            duplicates.append(line)
+            continue
+        seen.add(line["transaction_id"])
+
+        if line.get("error"):
+            unmatched.append(line)
+            continue
+        invoice, rule = index.match(line)
+        if invoice is None:
+            unmatched.append(line)
+            continue
+        remaining = index.apply(invoice["id"], line["amount"])
+        payments.append({
+            "invoice_id": invoice["id"],
+            "amount": line["amount"],
+            "payment_method": payment_method.value,
+            "status": PaymentStatus.COMPLETED.value,
+            "transaction_id": line["transaction_id"],
+            "payment_date": line["date"] or datetime.utcnow().isoformat(),
+            "notes": f"Reconciled from {filename} line {line['line_number']} ({rule})",
+        })
+        matched.append({
+            "line_number": line["line_number"],
+            "invoice_id": invoice["id"],
+            "invoice_number": invoice["invoice_number"],
+            "amount": line["amount"],
+            "rule": rule,
+            "remaining": round(max(remaining, 0.0), 2),
+        })
+
+    # Expected final status of every touched invoice, for the report; the
+    # stored status is derived from invoice_balances when the payments land
+    status_updates: Dict[str, List[int]] = defaultdict(list)
+    for invoice_id in {payment["invoice_id"] for payment in payments}:
+        status = InvoiceStatus.PAID if index.outstanding[invoice_id] <= PAID_TOLERANCE else InvoiceStatus.PARTIALLY_PAID
+        status_updates[status.value].append(invoice_id)
+
+    inserted: List[Dict] = []
+    if not dry_run and payments:
+        inserted = await db.apply_reconciled_payments(payments)
+
+    logger.info(
+        f"Reconciled {filename}: {len(lines)} lines, {len(matched)} matched, "
+        f"{len(unmatched)} unmatched, {len(inserted)} payments inserted"
+    )
+    return {
+        "dry_run": dry_run,
+        "total_lines": len(lines),
+        "matched_count": len(matched),
+        "unmatched_count": len(unmatched),
+        "payments_inserted": len(inserted),
+        "duplicates_skipped": len(duplicates),
+        "invoices_paid": len(status_updates.get(InvoiceStatus.PAID.value, [])),
+        "invoices_partially_paid": len(status_updates.get(InvoiceStatus.PARTIALLY_PAID.value, [])),
+        "matched": matched,
+        "unmatched": unmatched,
+    }
@@ -0,0 +1,182 @@
+import io
+import os
+import math
+import time
+import asyncio
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Sequence, Tuple, Union
+from dotenv import load_dotenv
+from app.metrics import RENDER_SECONDS
+
+if TYPE_CHECKING:
+    import fitz
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 0 renders in a thread of the event loop's default executor instead of a process pool
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+# Pages per task sent to a worker; small chunks let extraction start early
+RENDER_CHUNK_PAGES = int(os.getenv("RENDER_CHUNK_PAGES", 4))
+# Target pixels per rendered page; zoom is chosen from the page size to hit it
+RENDER_PIXEL_BUDGET = int(os.getenv("RENDER_PIXEL_BUDGET", 4_000_000))
+RENDER_MIN_ZOOM = float(os.getenv("RENDER_MIN_ZOOM", 1))
+RENDER_MAX_ZOOM = float(os.getenv("RENDER_MAX_ZOOM", 4))
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "jpeg").lower()
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", 85))
+
+RENDER_FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def adaptive_zoom(width: float, height: float, pixel_budget: int = RENDER_PIXEL_BUDGET) -> float:
+    """Zoom that renders a `width` x `height` point page to about `pixel_budget` pixels."""
+    zoom = math.sqrt(pixel_budget / max(width * height, 1.0))
+    return min(max(zoom, RENDER_MIN_ZOOM), RENDER_MAX_ZOOM)
+
+
+def image_mime_type(image_content: bytes) -> str:
+    """MIME type of a rendered page, told apart by its file signature."""
+    if image_content[:4] == b"RIFF" and image_content[8:12] == b"WEBP":
+        return RENDER_FORMATS["webp"]
+    return RENDER_FORMATS["jpeg"]
+
+
+def _encode(pix: "fitz.Pixmap", fmt: str, quality: int) -> bytes:
+    if fmt == "webp":
+        from PIL import Image
+
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality)
+        return buffer.getvalue()
+    return pix.tobytes("jpeg", jpg_quality=quality)
+
+
+def _open_pdf(source: Union[bytes, str]) -> "fitz.Document":
+    import fitz  # PyMuPDF
+
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def render_page_range(
+    source: Union[bytes, str],
+    page_numbers: Sequence[int],
+    zoom: Optional[float] = None,
+    fmt: str = RENDER_FORMAT,
+    quality: int = RENDER_QUALITY
+) -> List[Tuple[int, bytes]]:
+    """
+    Render the given 1-based pages of a PDF, given as bytes or a file path, to
+    encoded images. Runs inside pool workers, so it only takes and returns
+    picklable values.
+    """
+    import fitz  # PyMuPDF
+
+    rendered = []
+    with _open_pdf(source) as pdf_document:
+        for page_number in page_numbers:
+            page = pdf_document.load_page(page_number - 1)
+            page_zoom = zoom or adaptive_zoom(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(page_zoom, page_zoom), alpha=False)
+            rendered.append((page_number, _encode(pix, fmt, quality)))
+            pix = None  # release the raw pixmap before the next page
+    return rendered
+
+
+def _get_pool() -> Optional[Executor]:
+    global _pool
+    if RENDER_WORKERS <= 0:
+        return None
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and thread pools is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def check_render_format(fmt: str) -> None:
+    """Raise ValueError if `fmt` is unknown or its optional dependency is missing."""
+    if fmt not in RENDER_FORMATS:
+        raise ValueError(f"Unsupported render format: {fmt}")
+    if fmt == "webp":
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise ValueError("WebP rendering requires the Pillow package")
+
+
+def _spool(pdf_bytes: bytes) -> str:
+    with tempfile.NamedTemporaryFile(prefix="render_", suffix=".pdf", delete=False) as pdf_file:
+        pdf_file.write(pdf_bytes)
+        return pdf_file.name
+
+
+def _observe_chunk(started: float):
+    def observe(future: asyncio.Future) -> None:
+        if not future.cancelled():
+            RENDER_SECONDS.labels("chunk").observe(time.perf_counter() - started)
+    return observe
+
+
+async def render_pages(
+    pdf_bytes: bytes,
+    page_numbers: Sequence[int],
+    zoom: Optional[float] = None,
+    fmt: str = RENDER_FORMAT,
+    quality: int = RENDER_QUALITY
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Render pages across the worker pool, yielding (page_number, image_bytes)
+    in page order. Only a bounded number of chunks is in flight, so memory
+    stays flat however long the document is.
+    Pool workers read the PDF from a temporary file rather than receiving a
+    pickled copy of it with every chunk.
+    """
+    check_render_format(fmt)
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    source: Union[bytes, str] = pdf_bytes
+    if pool is not None and page_numbers:
+        source = await asyncio.to_thread(_spool, pdf_bytes)
+    workers = max(RENDER_WORKERS, 1)
+    chunk_size = max(1, min(RENDER_CHUNK_PAGES, math.ceil(len(page_numbers) / workers)))
+    chunks = [page_numbers[i:i + chunk_size] for i in range(0, len(page_numbers), chunk_size)]
+
+    pending: List[asyncio.Future] = []
+    next_chunk = 0
+    try:
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < workers * 2:
+                future = loop.run_in_executor(
+                    pool, render_page_range, source, chunks[next_chunk], zoom, fmt, quality
+                )
+                future.add_done_callback(_observe_chunk(time.perf_counter()))
+                pending.append(future)
+                next_chunk += 1
+            for page in await pending.pop(0):
+                logger.info(f"Rendered page {page[0]}")
+                yield page
+    finally:
+        for future in pending:
+            future.cancel()
+        if isinstance(source, str):
+            try:
+                os.unlink(source)
+            except OSError as e:
+                logger.warning(f"Could not remove spooled PDF {source}: {str(e)}")
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.numbers import parse_amount
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TEXT_LAYER_ENABLED = os.getenv("TEXT_LAYER_ENABLED", "true").lower() == "true"
+# Pages with less extractable text than this are treated as scans
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 200))
+SUPPLIER_TEMPLATES_PATH = os.getenv("SUPPLIER_TEMPLATES_PATH", "supplier_templates.json")
+
+AMOUNT_FIELDS = ("discount", "tax_amount", "total_amount")
+
+
+class TextPage:
+    """A digital PDF page: its text layer plus any tables PyMuPDF detected."""
+
+    def __init__(self, page_number: int, text: str, tables: List[List[List[Optional[str]]]]):
+        self.page_number = page_number
+        self.text = text
+        self.tables = tables
+
+    def as_prompt_text(self) -> str:
+        parts = [self.text.strip()]
+        for index, rows in enumerate(self.tables, start=1):
+            lines = [" | ".join(cell or "" for cell in row) for row in rows]
+            parts.append(f"Table {index}:\n" + "\n".join(lines))
+        return "\n\n".join(parts)
+
+
+def classify_pages(pdf_bytes: bytes) -> Tuple[List[TextPage], List[int]]:
+    """
+    Split a PDF into digital pages, read from their text layer, and the
+    numbers of scanned pages that still need rendering for the vision model.
+    """
+    import fitz  # PyMuPDF
+
+    if not TEXT_LAYER_ENABLED:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            return [], list(range(1, len(pdf_document) + 1))
+
+    text_pages: List[TextPage] = []
+    scanned: List[int] = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        for page_num in range(len(pdf_document)):
+            page = pdf_document.load_page(page_num)
+            text = page.get_text("text")
+            if len(text.strip()) < TEXT_LAYER_MIN_CHARS:
+                scanned.append(page_num + 1)
+                continue
+            try:
+                tables = [table.extract() for table in page.find_tables().tables]
+            except Exception as e:
+                logger.warning(f"Table detection failed on page {page_num + 1}: {str(e)}")
+                tables = []
+            text_pages.append(TextPage(page_num + 1, text, tables))
+
+    logger.info(f"Classified PDF: {len(text_pages)} digital pages, {len(scanned)} scanned pages")
+    return text_pages, scanned
+
+
+class SupplierTemplate:
+    """
+    Deterministic parser for one supplier's invoice layout.
+    `fields` maps extraction field names to regexes whose first group holds
+    the value; `items_table` gives the table index, header row count and the
+    column of each line-item field.
+    """
+
+    def __init__(
+        self,
+        gstin: str,
+        fields: Dict[str, str],
+        date_format: str = "%d/%m/%Y",
+        items_table: Optional[Dict] = None,
+        seller: Optional[str] = None
+    ):
+        self.gstin = gstin
+        self.fields = {name: re.compile(pattern, re.I | re.M) for name, pattern in fields.items()}
+        self.date_format = date_format
+        self.items_table = items_table
+        self.seller = seller
+
+    def parse(self, page: TextPage) -> Dict:
+        """Return raw extraction fields for `page`; validation is left to the caller."""
+        data: Dict = {"seller": self.seller, "seller_gst_no": self.gstin}
+        for name, pattern in self.fields.items():
+            match = pattern.search(page.text)
+            data[name] = match.group(1).strip() if match else None
+
+        for name in AMOUNT_FIELDS:
+            if name in data:
+                data[name] = parse_amount(data[name])
+        if data.get("issue_date"):
+            try:
+                data["issue_date"] = datetime.strptime(data["issue_date"], self.date_format).date().isoformat()
+            except ValueError:
+                pass  # left as-is so validation reports the field
+
+        if self.items_table is not None:
+            data["line_items"] = self._parse_items(page.tables)
+        return data
+
+    def _parse_items(self, tables: List[List[List[Optional[str]]]]) -> List[Dict]:
+        spec = self.items_table
+        index = spec.get("index", 0)
+        if index >= len(tables):
+            return []
+        columns = spec["columns"]
+        items = []
+        for row in tables[index][spec.get("header_rows", 1):]:
+            cells = {name: row[column] if column < len(row) else None for name, column in columns.items()}
+            description = (cells.get("description") or "").strip()
+            if not description:
+                continue
+            items.append({
+                "description": " ".join(description.split()),
+                "quantity": parse_amount(cells.get("quantity")),
+                "rate": parse_amount(cells.get("rate")),
+            })
+        return items
+
+
+@lru_cache()
+def load_supplier_templates(path: str = SUPPLIER_TEMPLATES_PATH) -> Dict[str, SupplierTemplate]:
+    """Load templates keyed by supplier GSTIN from a JSON file; an absent file means none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as templates_file:
+        raw = json.load(templates_file)
+    templates = {gstin.upper(): SupplierTemplate(gstin.upper(), **spec) for gstin, spec in raw.items()}
+    logger.info(f"Loaded {len(templates)} supplier templates from {path}")
+    return templates
+
+
+def find_template(page: TextPage) -> Optional[SupplierTemplate]:
+    """The template of the first known supplier GSTIN printed on the page, if any."""
+    text = page.text.upper()
+    for gstin, template in load_supplier_templates().items():
+        if gstin in text:
+            return template
+    return None
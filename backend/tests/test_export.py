@@ -0,0 +1,49 @@
+import io
+import asyncio
+from decimal import Decimal
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pytest.importorskip("supabase")
+import pyarrow.parquet as pq
+
+from services.export import _stream_parquet
+
+
+async def _batches():
+    yield [{
+        "id": 1, "invoice_number": "INV-1", "buyer_id": 7, "supplier_id": None,
+        "amount": 1000, "tax_amount": 180.5, "total_amount": 1180.5,
+        "due_date": "2024-03-31T00:00:00+00:00", "notes": None,
+        "payments": [{"amount": 500}],
+    }]
+    yield [{
+        "id": 2, "invoice_number": "INV-2", "buyer_id": 8, "supplier_id": 3,
+        "amount": 10, "tax_amount": 0, "total_amount": 10,
+        "due_date": "2024-04-30T12:30:00.123456+00:00", "notes": "rush",
+        "payments": [],
+    }]
+
+
+def _export() -> "pa.Table":
+    async def collect():
+        return b"".join([chunk async for chunk in _stream_parquet(_batches())])
+    return pq.read_table(io.BytesIO(asyncio.run(collect())))
+
+
+def test_parquet_keeps_column_types():
+    schema = _export().schema
+    assert schema.field("id").type == pa.int64()
+    assert schema.field("buyer_id").type == pa.int64()
+    assert schema.field("total_amount").type == pa.decimal128(12, 2)
+    assert schema.field("due_date").type == pa.timestamp("us", tz="UTC")
+    assert schema.field("invoice_number").type == pa.string()
+    assert schema.field("payments").type == pa.string()
+
+
+def test_parquet_values_round_trip():
+    rows = _export().to_pylist()
+    assert [row["id"] for row in rows] == [1, 2]
+    assert rows[0]["total_amount"] == Decimal("1180.50")
+    assert rows[0]["supplier_id"] is None
+    assert rows[1]["due_date"].isoformat() == "2024-04-30T12:30:00.123456+00:00"
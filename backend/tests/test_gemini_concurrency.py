@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("pandas")
+
+from services import gemini
+from services.text_layer import TextPage
+
+
+def test_text_and_scanned_pages_share_one_concurrency_budget(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def fake_request(result):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return result
+
+    async def extract_text(page):
+        return await fake_request({"invoice_number": f"T{page.page_number}"})
+
+    async def extract_chunk(chunk):
+        return {page_number: await fake_request({"invoice_number": f"S{page_number}"}) for page_number, _ in chunk}
+
+    async def render_pages(pdf, page_numbers):
+        for page_number in page_numbers:
+            yield page_number, b"png"
+
+    text_pages = [TextPage(page_number, "text", []) for page_number in range(1, 7)]
+    scanned_pages = list(range(7, 13))
+    monkeypatch.setattr(gemini, "GEMINI_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(gemini, "EXTRACTION_CSV_DIR", None)
+    monkeypatch.setattr(gemini, "classify_pages", lambda pdf: (text_pages, scanned_pages))
+    monkeypatch.setattr(gemini, "render_pdf_pages", render_pages)
+    monkeypatch.setattr(gemini, "extract_text_invoice_data", extract_text)
+    monkeypatch.setattr(gemini, "_extract_chunk", extract_chunk)
+    monkeypatch.setattr(gemini.batch_sizer, "size", lambda: 1)
+
+    df, _ = asyncio.run(gemini.process_pdf_invoice(b"%PDF"))
+
+    assert list(df["page_number"]) == list(range(1, 13))
+    assert peak <= 2
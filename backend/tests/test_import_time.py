@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+pytest.importorskip("fastapi")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cumulative import time allowed for app.main, in seconds
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", 1.5))
+# Ingestion dependencies that must only load once a PDF is processed
+DEFERRED_MODULES = ("fitz", "pandas", "google.generativeai")
+
+
+def _import_app() -> subprocess.CompletedProcess:
+    script = (
+        "import sys, json, app.main; "
+        f"print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))"
+    )
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "LOG_FILE": ""},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def _cumulative_seconds(importtime_log: str, module: str) -> float:
+    # Lines read "import time: self [us] | cumulative | imported package"
+    for line in importtime_log.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1_000_000
+    raise AssertionError(f"{module} not found in -X importtime output")
+
+
+def test_app_import_defers_ingestion_stack():
+    result = _import_app()
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_app_import_time_within_budget():
+    result = _import_app()
+    assert _cumulative_seconds(result.stderr, "app.main") <= IMPORT_TIME_BUDGET
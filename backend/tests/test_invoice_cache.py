@@ -0,0 +1,14 @@
+import asyncio
+from database.cache import InvoiceCache
+
+
+def test_local_tier_serves_rows_in_a_single_worker():
+    cache = InvoiceCache(max_size=10, ttl=30)
+    asyncio.run(cache.set({"id": 1, "updated_at": "t1"}))
+    assert asyncio.run(cache.get(1)) == {"id": 1, "updated_at": "t1"}
+
+
+def test_cache_without_local_tier_or_redis_caches_nothing():
+    cache = InvoiceCache(max_size=10, ttl=30, local=False)
+    asyncio.run(cache.set({"id": 1, "updated_at": "t1"}))
+    assert asyncio.run(cache.get(1)) is None
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("aiosmtplib")
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+from services.mailer import MailDelivery, OutgoingEmail
+
+
+class CollectingHandler:
+    """aiosmtpd handler that keeps every accepted message and the session it came on."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 Message accepted for delivery"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _config(port: int):
+    class LocalRelayConfig:
+        SMTP_HOST = "127.0.0.1"
+        SMTP_PORT = port
+        SMTP_USER = None
+        SMTP_PASSWORD = None
+        SMTP_START_TLS = False
+        SMTP_TIMEOUT = 5.0
+        EMAIL_FROM = "billing@example.com"
+        SMTP_POOL_SIZE = 3
+        SMTP_MESSAGES_PER_MINUTE = 6000.0
+        SMTP_DOMAIN_MESSAGES_PER_MINUTE = 6000.0
+        SMTP_MAX_RETRIES = 1
+
+    return LocalRelayConfig
+
+
+def test_pooled_sends_arrive_at_relay():
+    handler = CollectingHandler()
+    port = _free_port()
+    controller = controller_module.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        emails = [
+            OutgoingEmail(f"reminder-{index}", f"buyer{index}@example.org", f"Invoice {index}", "<p>Due</p>")
+            for index in range(10)
+        ]
+
+        async def deliver():
+            delivery = MailDelivery(_config(port))
+            try:
+                return await delivery.send_all(emails, already_sent={"reminder-9"})
+            finally:
+                await delivery.close()
+
+        outcome = asyncio.run(deliver())
+    finally:
+        controller.stop()
+
+    assert sorted(outcome["sent"]) == sorted(f"reminder-{index}" for index in range(9))
+    assert outcome["skipped"] == ["reminder-9"]
+    assert sorted(envelope.rcpt_tos[0] for envelope in handler.messages) == sorted(
+        f"buyer{index}@example.org" for index in range(9)
+    )
+    assert len(handler.sessions) <= 3
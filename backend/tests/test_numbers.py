@@ -0,0 +1,34 @@
+import pytest
+from services.numbers import parse_amount, split_amounts
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,23,456.50", 123456.50),
+    ("123,456.50", 123456.50),
+    ("500", 500.0),
+    ("Rs. 500", 500.0),
+    ("Rs.1,200.00", 1200.0),
+    ("1,000/-", 1000.0),
+    ("Rs 1,000/-", 1000.0),
+    ("INR 2,50,000", 250000.0),
+    ("₹ 750.25", 750.25),
+    ("(200.00)", -200.0),
+    ("-500.00", -500.0),
+    (1200, 1200.0),
+    (12.5, 12.5),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "-", ".", "Rs.", "nan", "abc", "12 34", float("nan")])
+def test_parse_amount_rejects_non_amounts(value):
+    assert parse_amount(value) is None
+
+
+def test_split_amounts_rejoins_grouped_numbers():
+    assert split_amounts(["1", "200", "50"], 2) == [1200.0, 50.0]
+
+
+def test_split_amounts_pads_to_expected():
+    assert split_amounts(["10"], 3) == [10.0, None, None]
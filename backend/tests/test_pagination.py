@@ -0,0 +1,68 @@
+import re
+import asyncio
+import pytest
+
+postgrest = pytest.importorskip("postgrest")
+
+from database.supabase import Database
+
+KEYSET_OR = re.compile(r'^\((?:id\.gt\.(\d+)|(\w+)\.gt\."([^"]*)",and\(\w+\.eq\."[^"]*",id\.gt\.(\d+)\))\)$')
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+def _database(rows, executed):
+    """A Database whose queries are built by postgrest-py and answered from `rows`."""
+    db = Database.__new__(Database)
+    db.client = postgrest.SyncPostgrestClient("http://localhost")
+
+    async def execute(query):
+        params = query.params
+        executed.append(params)
+        order = params["order"].split(",")
+        selected = sorted(rows, key=lambda row: tuple(row[column] for column in order))
+        after = params.get("or")
+        if after:
+            match = KEYSET_OR.match(after)
+            if match.group(1):
+                selected = [row for row in selected if row["id"] > int(match.group(1))]
+            else:
+                sort, key, last_id = match.group(2), match.group(3), int(match.group(4))
+                selected = [
+                    row for row in selected
+                    if row[sort] > key or (row[sort] == key and row["id"] > last_id)
+                ]
+        return FakeResult(selected[:int(params["limit"])])
+
+    db._execute = execute
+    return db
+
+
+def _walk(db, sort, limit):
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            rows, cursor = await db.get_invoices_page(None, sort, cursor, limit)
+            seen.extend(row["id"] for row in rows)
+            if cursor is None:
+                return seen
+    return asyncio.run(walk())
+
+
+def test_page_query_sends_one_order_param_with_id_tie_break():
+    executed = []
+    db = _database([{"id": 1, "due_date": "2024-03-01"}], executed)
+    _walk(db, "due_date", 10)
+    assert executed[0].get_list("order") == ["due_date,id"]
+
+
+def test_pages_lose_no_rows_when_sort_keys_tie():
+    # Ids deliberately out of due_date order, with many rows sharing a due date
+    rows = [{"id": row_id, "due_date": f"2024-03-0{row_id % 3 + 1}"} for row_id in range(1, 24)]
+    db = _database(rows, [])
+    seen = _walk(db, "due_date", 4)
+    assert sorted(seen) == list(range(1, 24))
+    assert len(seen) == len(set(seen))
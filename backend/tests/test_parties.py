@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+
+pytest.importorskip("supabase")
+
+from services.parties import PartyIndex
+
+
+class FakePartyDatabase:
+    """Stands in for Database: an empty party table that records bulk writes."""
+
+    def __init__(self):
+        self.upserted = []
+        self.by_name = []
+
+    async def get_parties(self, table):
+        return []
+
+    async def upsert_parties(self, table, parties, key="gst_no"):
+        rows, offset = (self.upserted, 0) if key == "gst_no" else (self.by_name, 100)
+        rows.extend(parties)
+        return [dict(party, id=offset + index) for index, party in enumerate(parties, 1)]
+
+
+def test_bulk_rows_share_one_key_set():
+    db = FakePartyDatabase()
+    details = [
+        {"name": "Acme Traders", "gst_no": "27AAPFU0939F1ZV", "city": "Pune"},
+        {"name": "Bharat Steel", "gst_no": "29AABCB1234C1Z5"},
+        {"name": "Kumar & Sons", "city": "Delhi"},
+        {"name": "Metro Supplies"},
+    ]
+    ids = asyncio.run(PartyIndex("buyers").resolve(db, details))
+
+    assert all(party_id is not None for party_id in ids)
+    for rows in (db.upserted, db.by_name):
+        assert len({frozenset(row) for row in rows}) == 1
+    assert db.upserted[1]["city"] is None
+
+
+def test_name_only_parties_are_upserted_on_normalised_name():
+    db = FakePartyDatabase()
+    asyncio.run(PartyIndex("buyers").resolve(db, [{"name": "M/s Kumar & Sons Pvt. Ltd."}, {"name": "kumar sons"}]))
+
+    assert [row["name_key"] for row in db.by_name] == ["kumar sons"]
+    assert all("name_key" not in row for row in db.upserted)
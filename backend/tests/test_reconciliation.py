@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("supabase")
+pytest.importorskip("sqlalchemy")
+
+from services.reconciliation import (
+    InvoiceIndex, parse_statement_date, reconcile_statement,
+    statement_transaction_id,
+)
+
+
+def _invoice(invoice_id, number, total, gst_no=None):
+    return {"id": invoice_id, "invoice_number": number, "total_amount": total, "buyers": {"gst_no": gst_no}}
+
+
+def _line(amount, description, reference=""):
+    return {"amount": amount, "description": description, "reference": reference}
+
+
+def test_distinctive_invoice_number_matches_partial_payment():
+    index = InvoiceIndex([_invoice(1, "INV-2024/017", 10000.0)])
+    invoice, rule = index.match(_line(2500.0, "NEFT PART PAYMENT INV-2024/017"))
+    assert invoice["id"] == 1 and rule == "invoice_number"
+
+
+def test_numeric_invoice_number_ignores_amount_fragment():
+    index = InvoiceIndex([_invoice(1, "5000", 1200.0)])
+    assert index.match(_line(5000.0, "UPI CR 5000.00 FROM ACME")) == (None, None)
+
+
+def test_numeric_invoice_number_matches_when_amount_agrees():
+    index = InvoiceIndex([_invoice(1, "5000", 1200.0)])
+    invoice, rule = index.match(_line(1200.0, "PAYMENT AGAINST BILL 5000"))
+    assert invoice["id"] == 1 and rule == "invoice_number"
+
+
+class _FakeDatabase:
+    def __init__(self, invoices):
+        self.invoices = invoices
+        self.applied = []
+
+    async def get_existing_transaction_ids(self, transaction_ids):
+        return set()
+
+    async def get_open_invoices(self):
+        return self.invoices
+
+    async def apply_reconciled_payments(self, payments):
+        self.applied.extend(payments)
+        return payments
+
+
+def test_statement_dates_follow_day_first_setting():
+    assert parse_statement_date("03/04/2024", day_first=True) == "2024-04-03"
+    assert parse_statement_date("03/04/2024", day_first=False) == "2024-03-04"
+    assert parse_statement_date("2024-04-03T10:15:00") == "2024-04-03"
+    assert parse_statement_date("3-Apr-24") == "2024-04-03"
+    assert parse_statement_date("  ") is None
+    with pytest.raises(ValueError):
+        parse_statement_date("31/31/2024")
+
+
+def test_unreadable_date_line_is_reported_unmatched():
+    content = (
+        "Date,Amount,Narration\n"
+        "05/04/2024,1200.00,PAYMENT INV-2024/017\n"
+        "yesterday,800.00,PAYMENT INV-2024/018\n"
+    ).encode()
+    db = _FakeDatabase([_invoice(1, "INV-2024/017", 1200.0), _invoice(2, "INV-2024/018", 800.0)])
+    result = asyncio.run(reconcile_statement(db, content, "statement.csv"))
+
+    assert [payment["invoice_id"] for payment in db.applied] == [1]
+    assert db.applied[0]["payment_date"] == "2024-04-05"
+    assert result["unmatched_count"] == 1
+    assert "yesterday" in result["unmatched"][0]["error"]
+
+
+def test_fallback_transaction_id_is_content_based_and_bounded():
+    line = {"line_number": 4, "date": "2024-04-05", "amount": 1200.0, "reference": "", "description": "UPI CR ACME"}
+    other_statement = dict(line, date="2024-05-05")
+
+    assert statement_transaction_id(line) == statement_transaction_id(dict(line))
+    assert statement_transaction_id(line) != statement_transaction_id(other_statement)
+    assert statement_transaction_id(dict(line, reference="UTR123")) == "UTR123"
+    assert len(statement_transaction_id(dict(line, reference="X" * 150))) <= 100
+
+
+def test_amount_match_follows_balance_after_partial_payment():
+    index = InvoiceIndex([_invoice(1, "INV-2024/017", 1000.0, gst_no="27AAPFU0939F1ZV")])
+    invoice, _ = index.match(_line(400.0, "PART PAYMENT INV-2024/017"))
+    index.apply(invoice["id"], 400.0)
+
+    assert index.match(_line(1000.0, "NEFT CR")) == (None, None)
+    assert index.match(_line(1000.0, "NEFT CR 27AAPFU0939F1ZV")) == (None, None)
+    invoice, rule = index.match(_line(600.0, "NEFT CR 27AAPFU0939F1ZV"))
+    assert invoice["id"] == 1 and rule == "gst_amount"
+    invoice, rule = index.match(_line(600.0, "NEFT CR"))
+    assert invoice["id"] == 1 and rule == "amount"